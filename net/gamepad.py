@@ -2,7 +2,12 @@
 Gamepad input handler for 3-phase pulse control.
 Uses the 'inputs' library for cross-platform gamepad support.
 """
+import errno
 import logging
+import os
+import select
+import struct
+import sys
 import threading
 
 from PySide6 import QtCore
@@ -39,12 +44,58 @@ EVENT_TO_BUTTON = {
     ('Key', 'BTN_Y'): 'y',
 }
 
+# Key event code -> button identifier, for dispatch without building a tuple key
+KEY_TO_BUTTON = {code: button_id for (ev_type, code), button_id in EVENT_TO_BUTTON.items() if ev_type == 'Key'}
+
 # D-pad handled separately since it's an absolute axis with positive/negative values
 
+# Scale factor for raw joystick axis values (signed 16-bit)
+_INV_AXIS = 1.0 / 32768.0
+
+# On Linux the evdev character device is read directly, which wakes up only
+# when the kernel has events instead of going through the library's reader.
+USE_EVDEV = sys.platform.startswith('linux')
+
+# Back off between rescans while no gamepad can be opened
+_REOPEN_DELAY_MIN_MS = 500
+_REOPEN_DELAY_MAX_MS = 5000
+
+# struct input_event: timeval (sec, usec), type, code, value
+_EVDEV_FMT = struct.Struct('llHHi')
+_EVDEV_READ_SIZE = _EVDEV_FMT.size * 64
+
+_EV_KEY = 0x01
+_EV_ABS = 0x03
+
+# Kernel event codes -> names used by the inputs library
+_EVDEV_ABS_CODES = {
+    0x00: 'ABS_X',
+    0x01: 'ABS_Y',
+    0x02: 'ABS_Z',
+    0x03: 'ABS_RX',
+    0x04: 'ABS_RY',
+    0x05: 'ABS_RZ',
+    0x10: 'ABS_HAT0X',
+    0x11: 'ABS_HAT0Y',
+}
+_EVDEV_KEY_CODES = {
+    0x130: 'BTN_SOUTH',
+    0x131: 'BTN_EAST',
+    0x133: 'BTN_NORTH',
+    0x134: 'BTN_WEST',
+    0x136: 'BTN_TL',
+    0x137: 'BTN_TR',
+    0x13a: 'BTN_SELECT',
+    0x13b: 'BTN_START',
+    0x13d: 'BTN_THUMBL',
+    0x13e: 'BTN_THUMBR',
+}
+
 
 class GamepadReaderThread(QThread):
     """
-    Background thread that reads gamepad events using the blocking inputs library.
+    Background thread that reads gamepad events, directly from evdev on Linux
+    and using the blocking inputs library elsewhere.
     Emits position_changed signal when joystick position changes.
     """
     position_changed = Signal(float, float)
@@ -60,6 +111,8 @@ class GamepadReaderThread(QThread):
     # Signal to notify button state changes for repeat handling
     button_state_changed = Signal()
 
+    _EMPTY = ()
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self._running = False
@@ -71,6 +124,8 @@ class GamepadReaderThread(QThread):
         self._invert_horizontal = False
         # Trigger threshold for treating as button press
         self._trigger_threshold = 0.5
+        self._trigger_threshold_int = 0
+        self.set_trigger_threshold(self._trigger_threshold)
 
         # Button mappings: action -> button_id
         self._button_mappings = {
@@ -86,6 +141,41 @@ class GamepadReaderThread(QThread):
             'mute': 'b',
         }
 
+        # Absolute event code -> handler(state)
+        self._abs_handlers = {
+            'ABS_X': self._handle_horizontal_axis,
+            'ABS_RX': self._handle_horizontal_axis,
+            'ABS_Y': self._handle_vertical_axis,
+            'ABS_RY': self._handle_vertical_axis,
+            'ABS_HAT0Y': self._handle_hat_y,
+            'ABS_HAT0X': self._handle_hat_x,
+            'ABS_Z': self._handle_left_trigger,
+            'ABS_RZ': self._handle_right_trigger,
+        }
+
+        # Action -> signal emit, called on initial press
+        self._action_emitters = {
+            'carrier_up': lambda: self.carrier_frequency_change.emit(1),
+            'carrier_down': lambda: self.carrier_frequency_change.emit(-1),
+            'volume_up': lambda: self.volume_change.emit(1),
+            'volume_down': lambda: self.volume_change.emit(-1),
+            'pulse_freq_up': lambda: self.pulse_frequency_change.emit(1),
+            'pulse_freq_down': lambda: self.pulse_frequency_change.emit(-1),
+            'pulse_width_up': lambda: self.pulse_width_change.emit(1),
+            'pulse_width_down': lambda: self.pulse_width_change.emit(-1),
+            'shock': lambda: self.shock_triggered.emit(),
+            'mute': lambda: self.mute_triggered.emit(),
+        }
+
+        # Raw evdev (type, code) -> handler(value), same handlers as above
+        self._evdev_handlers = {}
+        for code, name in _EVDEV_ABS_CODES.items():
+            self._evdev_handlers[(_EV_ABS, code)] = self._abs_handlers[name]
+        for code, name in _EVDEV_KEY_CODES.items():
+            button_id = KEY_TO_BUTTON[name]
+            self._evdev_handlers[(_EV_KEY, code)] = \
+                lambda value, button_id=button_id: self._handle_button_event(button_id, value == 1)
+
         # Build reverse mapping: button_id -> list of actions
         self._button_to_actions = {}
         self._rebuild_button_to_actions()
@@ -111,15 +201,19 @@ class GamepadReaderThread(QThread):
             'l3': False,
             'r3': False,
         }
+        # Copy of _held_buttons published once per event batch. Readers use it
+        # without taking the lock, the reference swap is atomic.
+        self._held_snapshot = self._held_buttons.copy()
 
     def _rebuild_button_to_actions(self):
         """Rebuild the reverse mapping from buttons to actions"""
-        self._button_to_actions = {}
+        button_to_actions = {}
         for action, button_id in self._button_mappings.items():
             if button_id and button_id != 'none':
-                if button_id not in self._button_to_actions:
-                    self._button_to_actions[button_id] = []
-                self._button_to_actions[button_id].append(action)
+                button_to_actions.setdefault(button_id, []).append(action)
+        self._button_to_actions = {button_id: tuple(actions) for button_id, actions in button_to_actions.items()}
+        self._shock_button_ids = {button_id for button_id, actions in self._button_to_actions.items()
+                                  if 'shock' in actions}
 
     def set_button_mappings(self, mappings: dict):
         """Set button mappings from settings"""
@@ -128,19 +222,31 @@ class GamepadReaderThread(QThread):
 
     def get_held_actions(self):
         """Get a dict of actions and whether their mapped button is held (thread-safe)"""
+        snapshot = self._held_snapshot
+        return {action: snapshot.get(button_id, False) if button_id and button_id != 'none' else False
+                for action, button_id in self._button_mappings.items()}
+
+    def is_action_held(self, action: str) -> bool:
+        """Check if the button mapped to an action is held (thread-safe)"""
+        button_id = self._button_mappings.get(action)
+        return bool(button_id) and self._held_snapshot.get(button_id, False)
+
+    def _publish_button_state(self):
+        """Publish the held button snapshot and notify listeners"""
         with self._state_lock:
-            result = {}
-            for action, button_id in self._button_mappings.items():
-                if button_id and button_id != 'none':
-                    result[action] = self._held_buttons.get(button_id, False)
-                else:
-                    result[action] = False
-            return result
+            self._held_snapshot = self._held_buttons.copy()
+        self.button_state_changed.emit()
 
     def set_dead_zone(self, dead_zone: float):
         """Set the joystick dead zone (0.0 to 1.0)"""
         self._dead_zone = max(0.0, min(1.0, dead_zone))
 
+    def set_trigger_threshold(self, threshold: float):
+        """Set the trigger press threshold (0.0 to 1.0)"""
+        self._trigger_threshold = threshold
+        # Triggers report raw 0-255 values, compare against the raw threshold
+        self._trigger_threshold_int = int(threshold * 255)
+
     def set_invert_vertical(self, invert: bool):
         """Set vertical inversion for joystick"""
         self._invert_vertical = invert
@@ -155,122 +261,193 @@ class GamepadReaderThread(QThread):
             return
 
         self._running = True
+        reopen_delay = _REOPEN_DELAY_MIN_MS
 
         while self._running:
             try:
                 gamepads = inputs.devices.gamepads
                 if not gamepads:
-                    if self._connected:
-                        self._connected = False
-                        self.connection_changed.emit(False)
-                    self.msleep(500)
+                    self._set_connected(False)
+                    reopen_delay = self._rescan_devices(reopen_delay)
                     continue
 
-                if not self._connected:
-                    self._connected = True
-                    self.connection_changed.emit(True)
-                    logger.info(f"Gamepad connected: {gamepads[0]}")
+                if USE_EVDEV:
+                    fd = self._open_evdev(gamepads[0])
+                    if fd is None:
+                        # An unplugged pad stays in the device list until it is rescanned
+                        self._set_connected(False)
+                        reopen_delay = self._rescan_devices(reopen_delay)
+                        continue
+                    reopen_delay = _REOPEN_DELAY_MIN_MS
+                    self._set_connected(True, gamepads[0])
+                    self._read_evdev(fd)
+                    continue
 
+                reopen_delay = _REOPEN_DELAY_MIN_MS
+                self._set_connected(True, gamepads[0])
                 events = inputs.get_gamepad()
 
+                buttons_changed = False
                 for event in events:
                     if not self._running:
                         break
-                    self._process_event(event)
+                    buttons_changed |= self._process_event(event)
+
+                # Notify once per batch, and only if a button actually changed
+                if buttons_changed:
+                    self._publish_button_state()
 
             except inputs.UnpluggedError:
-                if self._connected:
-                    self._connected = False
-                    self.connection_changed.emit(False)
-                    logger.info("Gamepad disconnected")
+                self._set_connected(False)
                 # Clear held buttons on disconnect
                 with self._state_lock:
                     for key in self._held_buttons:
                         self._held_buttons[key] = False
-                self.button_state_changed.emit()
+                self._publish_button_state()
                 self.msleep(500)
             except Exception as e:
                 logger.debug(f"Gamepad read error: {e}")
                 self.msleep(100)
 
-    def _process_event(self, event):
-        """Process a single gamepad event"""
+    def _set_connected(self, connected: bool, gamepad=None):
+        """Update the connection state, emits connection_changed only when it changes"""
+        if connected == self._connected:
+            return
+        self._connected = connected
+        self.connection_changed.emit(connected)
+        if connected:
+            logger.info(f"Gamepad connected: {gamepad}")
+        else:
+            logger.info("Gamepad disconnected")
+
+    def _rescan_devices(self, delay: int) -> int:
+        """
+        Back off, then rebuild the library's device list, which is otherwise
+        only built once at import. Returns the next back off delay.
+        """
+        self._sleep_while_running(delay)
+        if self._running:
+            inputs.devices = inputs.DeviceManager()
+        return min(delay * 2, _REOPEN_DELAY_MAX_MS)
+
+    def _sleep_while_running(self, ms: int):
+        """Sleep in short steps so stop() isn't held up by a long back off"""
+        while self._running and ms > 0:
+            self.msleep(min(ms, 100))
+            ms -= 100
+
+    @staticmethod
+    def _open_evdev(gamepad):
+        """Open the evdev device of the gamepad, returns None if it is gone"""
+        try:
+            return os.open(gamepad.get_char_device_path(), os.O_RDONLY | os.O_NONBLOCK)
+        except OSError as e:
+            logger.debug(f"Cannot open gamepad device: {e}")
+            return None
+
+    def _read_evdev(self, fd):
+        """Read events from an open evdev device until stopped or unplugged, closes fd"""
+        try:
+            while self._running:
+                readable, _, _ = select.select([fd], [], [], 0.5)
+                if not readable:
+                    continue
+                try:
+                    data = os.read(fd, _EVDEV_READ_SIZE)
+                except BlockingIOError:
+                    continue
+                except OSError as e:
+                    if e.errno == errno.ENODEV:
+                        raise inputs.UnpluggedError("Gamepad device removed")
+                    raise
+                if not data:
+                    raise inputs.UnpluggedError("Gamepad device closed")
+
+                buttons_changed = False
+                handlers = self._evdev_handlers
+                end = len(data) - len(data) % _EVDEV_FMT.size
+                for _, _, ev_type, code, value in _EVDEV_FMT.iter_unpack(data[:end]):
+                    handler = handlers.get((ev_type, code))
+                    if handler:
+                        buttons_changed |= handler(value)
+
+                if buttons_changed:
+                    self._publish_button_state()
+        finally:
+            os.close(fd)
+
+    def _process_event(self, event) -> bool:
+        """Process a single gamepad event, returns True if a button state changed"""
         if event.ev_type == 'Absolute':
-            if event.code in ('ABS_X', 'ABS_RX'):
-                raw_value = event.state / 32768.0
-                if self._invert_horizontal:
-                    raw_value = -raw_value
-                self._beta = self._apply_dead_zone(raw_value)
-                self._emit_position()
-            elif event.code in ('ABS_Y', 'ABS_RY'):
-                raw_value = -event.state / 32768.0
-                if self._invert_vertical:
-                    raw_value = -raw_value
-                self._alpha = self._apply_dead_zone(raw_value)
-                self._emit_position()
-            # D-pad (HAT)
-            elif event.code == 'ABS_HAT0Y':
-                # -1 = up, 1 = down, 0 = released
-                self._handle_button_event('dpad_up', event.state == -1)
-                self._handle_button_event('dpad_down', event.state == 1)
-            elif event.code == 'ABS_HAT0X':
-                # -1 = left, 1 = right, 0 = released
-                self._handle_button_event('dpad_left', event.state == -1)
-                self._handle_button_event('dpad_right', event.state == 1)
-            # Triggers as buttons (LT/RT)
-            elif event.code == 'ABS_Z':  # Left trigger (LT)
-                pressed = (event.state / 255.0) > self._trigger_threshold
-                self._handle_button_event('lt', pressed)
-            elif event.code == 'ABS_RZ':  # Right trigger (RT)
-                pressed = (event.state / 255.0) > self._trigger_threshold
-                self._handle_button_event('rt', pressed)
+            handler = self._abs_handlers.get(event.code)
+            if handler:
+                return handler(event.state)
         elif event.ev_type == 'Key':
             # Map event to button ID
-            button_id = EVENT_TO_BUTTON.get((event.ev_type, event.code))
+            button_id = KEY_TO_BUTTON.get(event.code)
             if button_id:
-                self._handle_button_event(button_id, event.state == 1)
-
-    def _handle_button_event(self, button_id: str, pressed: bool):
-        """Handle a button press/release event"""
+                return self._handle_button_event(button_id, event.state == 1)
+        return False
+
+    def _handle_horizontal_axis(self, state):
+        """Left/right stick X axis"""
+        raw_value = state * _INV_AXIS
+        if self._invert_horizontal:
+            raw_value = -raw_value
+        self._beta = self._apply_dead_zone(raw_value)
+        self._emit_position()
+        return False
+
+    def _handle_vertical_axis(self, state):
+        """Left/right stick Y axis"""
+        raw_value = -state * _INV_AXIS
+        if self._invert_vertical:
+            raw_value = -raw_value
+        self._alpha = self._apply_dead_zone(raw_value)
+        self._emit_position()
+        return False
+
+    def _handle_hat_y(self, state):
+        """D-pad vertical: -1 = up, 1 = down, 0 = released"""
+        changed = self._handle_button_event('dpad_up', state == -1)
+        return self._handle_button_event('dpad_down', state == 1) or changed
+
+    def _handle_hat_x(self, state):
+        """D-pad horizontal: -1 = left, 1 = right, 0 = released"""
+        changed = self._handle_button_event('dpad_left', state == -1)
+        return self._handle_button_event('dpad_right', state == 1) or changed
+
+    def _handle_left_trigger(self, state):
+        """Left trigger (LT) as button"""
+        return self._handle_button_event('lt', state > self._trigger_threshold_int)
+
+    def _handle_right_trigger(self, state):
+        """Right trigger (RT) as button"""
+        return self._handle_button_event('rt', state > self._trigger_threshold_int)
+
+    def _handle_button_event(self, button_id: str, pressed: bool) -> bool:
+        """Handle a button press/release event, returns True if the state changed"""
         with self._state_lock:
             was_pressed = self._held_buttons.get(button_id, False)
+            if pressed == was_pressed:
+                return False
             self._held_buttons[button_id] = pressed
 
         # If button just pressed, emit signals for mapped actions
-        if pressed and not was_pressed:
-            actions = self._button_to_actions.get(button_id, [])
-            for action in actions:
+        if pressed:
+            for action in self._button_to_actions.get(button_id, self._EMPTY):
                 self._emit_action(action)
         # If button just released, check for shock release
-        elif not pressed and was_pressed:
-            actions = self._button_to_actions.get(button_id, [])
-            if 'shock' in actions:
-                self.shock_released.emit()
+        elif button_id in self._shock_button_ids:
+            self.shock_released.emit()
 
-        self.button_state_changed.emit()
+        return True
 
     def _emit_action(self, action: str):
         """Emit the signal for a specific action"""
-        if action == 'carrier_up':
-            self.carrier_frequency_change.emit(1)
-        elif action == 'carrier_down':
-            self.carrier_frequency_change.emit(-1)
-        elif action == 'volume_up':
-            self.volume_change.emit(1)
-        elif action == 'volume_down':
-            self.volume_change.emit(-1)
-        elif action == 'pulse_freq_up':
-            self.pulse_frequency_change.emit(1)
-        elif action == 'pulse_freq_down':
-            self.pulse_frequency_change.emit(-1)
-        elif action == 'pulse_width_up':
-            self.pulse_width_change.emit(1)
-        elif action == 'pulse_width_down':
-            self.pulse_width_change.emit(-1)
-        elif action == 'shock':
-            self.shock_triggered.emit()
-        elif action == 'mute':
-            self.mute_triggered.emit()
+        emitter = self._action_emitters.get(action)
+        if emitter:
+            emitter()
 
     def _apply_dead_zone(self, value: float) -> float:
         """Apply dead zone to joystick value"""
@@ -314,6 +491,18 @@ class GamepadHandler(QtCore.QObject):
         self._repeat_rate = 100  # ms
         self._button_mappings = {}
 
+        # Repeatable action -> signal emit, called on every repeat tick
+        self._repeat_emitters = {
+            'carrier_up': lambda: self.carrier_frequency_change.emit(1),
+            'carrier_down': lambda: self.carrier_frequency_change.emit(-1),
+            'volume_up': lambda: self.volume_change.emit(1),
+            'volume_down': lambda: self.volume_change.emit(-1),
+            'pulse_freq_up': lambda: self.pulse_frequency_change.emit(1),
+            'pulse_freq_down': lambda: self.pulse_frequency_change.emit(-1),
+            'pulse_width_up': lambda: self.pulse_width_change.emit(1),
+            'pulse_width_down': lambda: self.pulse_width_change.emit(-1),
+        }
+
         # Timer for button repeat
         self._repeat_timer = QTimer(self)
         self._repeat_timer.timeout.connect(self._on_repeat_timer)
@@ -374,15 +563,18 @@ class GamepadHandler(QtCore.QObject):
         self._reader_thread.set_invert_vertical(self._invert_vertical)
         self._reader_thread.set_invert_horizontal(self._invert_horizontal)
         self._reader_thread.set_button_mappings(self._button_mappings)
-        self._reader_thread.position_changed.connect(self.position_changed)
-        self._reader_thread.connection_changed.connect(self.connection_changed)
-        self._reader_thread.carrier_frequency_change.connect(self.carrier_frequency_change)
-        self._reader_thread.volume_change.connect(self.volume_change)
-        self._reader_thread.pulse_frequency_change.connect(self.pulse_frequency_change)
-        self._reader_thread.pulse_width_change.connect(self.pulse_width_change)
-        self._reader_thread.shock_triggered.connect(self.shock_triggered)
-        self._reader_thread.shock_released.connect(self.shock_released)
-        self._reader_thread.mute_triggered.connect(self.mute_triggered)
+        # Forward reader signals with a direct connection: the forwarder is a pure
+        # re-emit, so only the handler -> consumer hop is queued across threads.
+        direct = QtCore.Qt.ConnectionType.DirectConnection
+        self._reader_thread.position_changed.connect(self.position_changed, direct)
+        self._reader_thread.connection_changed.connect(self.connection_changed, direct)
+        self._reader_thread.carrier_frequency_change.connect(self.carrier_frequency_change, direct)
+        self._reader_thread.volume_change.connect(self.volume_change, direct)
+        self._reader_thread.pulse_frequency_change.connect(self.pulse_frequency_change, direct)
+        self._reader_thread.pulse_width_change.connect(self.pulse_width_change, direct)
+        self._reader_thread.shock_triggered.connect(self.shock_triggered, direct)
+        self._reader_thread.shock_released.connect(self.shock_released, direct)
+        self._reader_thread.mute_triggered.connect(self.mute_triggered, direct)
         self._reader_thread.button_state_changed.connect(self._on_button_state_changed)
         self._reader_thread.start()
         logger.info("Gamepad reader started")
@@ -418,25 +610,12 @@ class GamepadHandler(QtCore.QObject):
             self._repeat_timer.stop()
             return
 
-        held_actions = self._reader_thread.get_held_actions()
+        reader = self._reader_thread
 
         # Emit signals for held actions
-        if held_actions.get('carrier_up'):
-            self.carrier_frequency_change.emit(1)
-        if held_actions.get('carrier_down'):
-            self.carrier_frequency_change.emit(-1)
-        if held_actions.get('volume_up'):
-            self.volume_change.emit(1)
-        if held_actions.get('volume_down'):
-            self.volume_change.emit(-1)
-        if held_actions.get('pulse_freq_up'):
-            self.pulse_frequency_change.emit(1)
-        if held_actions.get('pulse_freq_down'):
-            self.pulse_frequency_change.emit(-1)
-        if held_actions.get('pulse_width_up'):
-            self.pulse_width_change.emit(1)
-        if held_actions.get('pulse_width_down'):
-            self.pulse_width_change.emit(-1)
+        for action, emitter in self._repeat_emitters.items():
+            if reader.is_action_held(action):
+                emitter()
 
     def is_available(self) -> bool:
         """Check if gamepad support is available"""
@@ -5,25 +5,98 @@ Connects to remote Restim WebUI servers and forwards position/state changes.
 """
 
 import asyncio
-import json
+import base64
 import logging
 import threading
-import time
-from typing import Optional, List, Dict, Set
-from dataclasses import dataclass
+from typing import Optional, List, Dict, Set, Union
+from dataclasses import dataclass, field
 
 from PySide6 import QtCore
 
+from net.webserver.protocol import dumps, loads
+
 logger = logging.getLogger('restim.remote_control')
 
 
-@dataclass
+# Messages are sent as the serializer produces them: orjson's bytes in binary
+# frames, json's str in text frames. The Web UI server parses commands from both.
+
+# Messages without parameters never change, serialize them once
+_PLAY_MESSAGE = dumps({"type": "play", "payload": {}})
+_STOP_MESSAGE = dumps({"type": "stop", "payload": {}})
+
+
+def _encode_set_position(alpha: float, beta: float, gamma: float) -> str:
+    """
+    Encode a set_position message without building a dict.
+
+    Equivalent to dumps({"type": "set_position", "payload": {...}}), with
+    the position rounded to 4 decimals. Stays JSON so older instances accept it.
+    """
+    return (
+        f'{{"type":"set_position","payload":{{"alpha":{alpha:.4f},"beta":{beta:.4f},'
+        f'"gamma":{gamma:.4f},"interval":0.1}}}}'
+    )
+
+
+def _compute_ws_url(http_url: str) -> str:
+    """Convert a remote Web UI URL to its WebSocket URL."""
+    ws_url = http_url
+    if ws_url.startswith('http://'):
+        ws_url = 'ws://' + ws_url[7:]
+    elif ws_url.startswith('https://'):
+        ws_url = 'wss://' + ws_url[8:]
+
+    # WebSocket is on port + 1
+    if ':' in ws_url.split('/')[-1]:
+        # Has port
+        parts = ws_url.rsplit(':', 1)
+        try:
+            port = int(parts[1].split('/')[0])
+            ws_url = f"{parts[0]}:{port + 1}"
+        except ValueError:
+            pass
+
+    return ws_url
+
+
+@dataclass(frozen=True, slots=True)
 class RemoteInstance:
     """Configuration for a remote Restim instance."""
     url: str
     enabled: bool = True
     username: str = ""
     password: str = ""
+    _auth_header: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    _ws_url: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        # Derive connection parameters once, not on every reconnect
+        object.__setattr__(self, '_ws_url', _compute_ws_url(self.url))
+        if self.username and self.password:
+            credentials = base64.b64encode(f"{self.username}:{self.password}".encode()).decode()
+            object.__setattr__(self, '_auth_header', f'Basic {credentials}')
+
+    def ws_url(self) -> str:
+        """WebSocket URL of the remote instance."""
+        return self._ws_url
+
+    def auth_header(self) -> Optional[str]:
+        """HTTP Basic Authorization header value, or None if no credentials are set."""
+        return self._auth_header
+
+
+def parse_instances(instances_json: str) -> List[RemoteInstance]:
+    """Parse the JSON array of instances stored in the remote_control/instances setting."""
+    return [
+        RemoteInstance(
+            url=data.get('url', ''),
+            enabled=data.get('enabled', True),
+            username=data.get('username', ''),
+            password=data.get('password', '')
+        )
+        for data in loads(instances_json)
+    ]
 
 
 class RemoteControlClient(QtCore.QObject):
@@ -39,23 +112,37 @@ class RemoteControlClient(QtCore.QObject):
         self._instances: List[RemoteInstance] = []
         self._connections: Dict[str, any] = {}  # url -> websocket
         self._connected: Set[str] = set()
+        # Immutable (url, websocket) pairs of open connections, rebuilt on
+        # connect/disconnect so the broadcast path can read it without the lock
+        self._connection_snapshot: tuple = ()
         self._running = False
         self._thread: Optional[threading.Thread] = None
         self._loop: Optional[asyncio.AbstractEventLoop] = None
         self._lock = threading.Lock()
 
-        # Throttling for position updates
-        self._last_position_send = 0
-        self._position_throttle_ms = 33  # ~30Hz
+        # Throttling for position updates. Only the latest position is kept,
+        # the loop thread sends it at most once per throttle interval.
+        self._position_throttle_s = 0.033  # ~30Hz
+        self._pending_position: Optional[tuple] = None
+        # Guards the hand-off of _pending_position between the Qt and loop threads
+        self._position_lock = threading.Lock()
+        self._position_event: Optional[asyncio.Event] = None
+        # Set by set_instances() to wake up _manage_connections
+        self._instances_changed: Optional[asyncio.Event] = None
 
     def set_instances(self, instances: List[RemoteInstance]):
         """Update the list of remote instances."""
         with self._lock:
-            self._instances = instances.copy()
+            if instances == self._instances:
+                # same configuration, keep the open connections
+                return
+            # removed or changed instances, unchanged ones keep their connection
+            current = set(instances)
+            stale = [instance for instance in self._instances if instance not in current]
+            self._instances = list(instances)
 
-        # Restart connections if running
         if self._running:
-            self._schedule_reconnect()
+            self._reconnect(stale)
 
     def get_instances(self) -> List[RemoteInstance]:
         """Get the current list of remote instances."""
@@ -82,8 +169,10 @@ class RemoteControlClient(QtCore.QObject):
             self._thread.join(timeout=2.0)
             self._thread = None
 
-        self._connected.clear()
-        self._connections.clear()
+        with self._lock:
+            self._connected.clear()
+            self._connections.clear()
+            self._rebuild_connection_snapshot()
 
     def is_connected(self, url: str) -> bool:
         """Check if connected to a specific instance."""
@@ -95,21 +184,32 @@ class RemoteControlClient(QtCore.QObject):
 
     def send_position(self, alpha: float, beta: float, gamma: float = 0.0):
         """Send position update to all connected instances."""
-        now = time.time() * 1000
-        if now - self._last_position_send < self._position_throttle_ms:
+        loop = self._loop
+        event = self._position_event
+        if not loop or not event or not self._running:
             return
-        self._last_position_send = now
 
-        message = {
-            "type": "set_position",
-            "payload": {
-                "alpha": alpha,
-                "beta": beta,
-                "gamma": gamma,
-                "interval": 0.1
-            }
-        }
-        self._broadcast(message)
+        with self._position_lock:
+            self._pending_position = (alpha, beta, gamma)
+        if not event.is_set():
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # loop closed while stopping
+                pass
+
+    async def _send_positions(self):
+        """Send the most recent pending position, at most once per throttle interval."""
+        while self._running:
+            await self._position_event.wait()
+            self._position_event.clear()
+            with self._position_lock:
+                position, self._pending_position = self._pending_position, None
+            if position is None:
+                continue
+
+            self._broadcast_on_loop(_encode_set_position(*position))
+            await asyncio.sleep(self._position_throttle_s)
 
     def send_volume(self, value: float):
         """Send volume update to all connected instances."""
@@ -129,13 +229,11 @@ class RemoteControlClient(QtCore.QObject):
 
     def send_play(self):
         """Send play command to all connected instances."""
-        message = {"type": "play", "payload": {}}
-        self._broadcast(message)
+        self._broadcast_raw(_PLAY_MESSAGE)
 
     def send_stop(self):
         """Send stop command to all connected instances."""
-        message = {"type": "stop", "payload": {}}
-        self._broadcast(message)
+        self._broadcast_raw(_STOP_MESSAGE)
 
     def send_pulse_params(self, **kwargs):
         """Send pulse parameter updates to all connected instances."""
@@ -150,23 +248,37 @@ class RemoteControlClient(QtCore.QObject):
         if not self._loop or not self._running:
             return
 
-        msg_str = json.dumps(message)
+        self._broadcast_raw(dumps(message))
 
-        with self._lock:
-            for url, ws in list(self._connections.items()):
-                if ws and url in self._connected:
-                    try:
-                        asyncio.run_coroutine_threadsafe(
-                            ws.send(msg_str),
-                            self._loop
-                        )
-                    except Exception as e:
-                        logger.debug(f"Failed to send to {url}: {e}")
+    def _broadcast_raw(self, msg: Union[str, bytes]):
+        """Broadcast an already serialized message to all connected instances."""
+        loop = self._loop
+        if not loop or not self._running:
+            return
+
+        try:
+            loop.call_soon_threadsafe(self._broadcast_on_loop, msg)
+        except RuntimeError:
+            # loop closed while stopping
+            pass
+
+    def _broadcast_on_loop(self, msg: Union[str, bytes]):
+        """Send a serialized message to all connected instances. Runs on the event loop."""
+        for url, ws in self._connection_snapshot:
+            task = asyncio.ensure_future(ws.send(msg))
+            task.add_done_callback(lambda t, url=url: self._on_send_done(t, url))
+
+    @staticmethod
+    def _on_send_done(task: asyncio.Task, url: str):
+        if not task.cancelled() and task.exception():
+            logger.debug("Failed to send to %s: %s", url, task.exception())
 
     def _run_event_loop(self):
         """Run the asyncio event loop in a background thread."""
         self._loop = asyncio.new_event_loop()
         asyncio.set_event_loop(self._loop)
+        self._position_event = asyncio.Event()
+        self._instances_changed = asyncio.Event()
 
         try:
             self._loop.run_until_complete(self._manage_connections())
@@ -175,61 +287,61 @@ class RemoteControlClient(QtCore.QObject):
         finally:
             self._loop.close()
             self._loop = None
+            self._position_event = None
+            self._instances_changed = None
+            self._pending_position = None
 
     async def _manage_connections(self):
         """Main connection management loop."""
         import websockets
 
+        position_task = asyncio.create_task(self._send_positions())
+        # url -> (instance, task) of every connection attempt, each task runs until its connection closes
+        connect_tasks: Dict[str, tuple] = {}
+
         while self._running:
             # Get enabled instances
             with self._lock:
                 instances = [i for i in self._instances if i.enabled]
 
-            # Start connections for new instances
-            tasks = []
+            # Start connections for instances without one
             for instance in instances:
-                if instance.url not in self._connections:
-                    tasks.append(self._connect(instance))
-
-            if tasks:
-                await asyncio.gather(*tasks, return_exceptions=True)
+                entry = connect_tasks.get(instance.url)
+                if entry is not None and not entry[1].done():
+                    if entry[0] == instance:
+                        continue
+                    # changed instance, its old connection is being closed by _reconnect()
+                    await asyncio.wait([entry[1]], timeout=2.0)
+                    if not entry[1].done():
+                        continue
+                connect_tasks[instance.url] = (instance, asyncio.create_task(self._connect(instance)))
+
+            # Wait before checking again, or until the instances change
+            self._instances_changed.clear()
+            try:
+                await asyncio.wait_for(self._instances_changed.wait(), 5.0)
+            except asyncio.TimeoutError:
+                pass
 
-            # Wait before checking again
-            await asyncio.sleep(5.0)
+        position_task.cancel()
 
     async def _connect(self, instance: RemoteInstance):
         """Connect to a remote instance."""
         import websockets
 
-        # Convert HTTP URL to WebSocket URL
-        ws_url = instance.url
-        if ws_url.startswith('http://'):
-            ws_url = 'ws://' + ws_url[7:]
-        elif ws_url.startswith('https://'):
-            ws_url = 'wss://' + ws_url[8:]
-
-        # WebSocket is on port + 1
-        if ':' in ws_url.split('/')[-1]:
-            # Has port
-            parts = ws_url.rsplit(':', 1)
-            try:
-                port = int(parts[1].split('/')[0])
-                ws_url = f"{parts[0]}:{port + 1}"
-            except ValueError:
-                pass
+        ws_url = instance.ws_url()
 
         logger.info(f"Connecting to remote instance: {ws_url}")
 
         try:
             # Build headers for auth if needed
             headers = {}
-            if instance.username and instance.password:
-                import base64
-                credentials = base64.b64encode(
-                    f"{instance.username}:{instance.password}".encode()
-                ).decode()
-                headers['Authorization'] = f'Basic {credentials}'
+            auth_header = instance.auth_header()
+            if auth_header:
+                headers['Authorization'] = auth_header
 
+            # asyncio already disables Nagle's algorithm (TCP_NODELAY) on TCP
+            # transports, so small position messages are sent immediately
             ws = await websockets.connect(
                 ws_url,
                 extra_headers=headers if headers else None,
@@ -238,8 +350,15 @@ class RemoteControlClient(QtCore.QObject):
             )
 
             with self._lock:
-                self._connections[instance.url] = ws
-                self._connected.add(instance.url)
+                # removed or changed while connecting
+                stale = instance not in self._instances
+                if not stale:
+                    self._connections[instance.url] = ws
+                    self._connected.add(instance.url)
+                    self._rebuild_connection_snapshot()
+            if stale:
+                await ws.close()
+                return
 
             self.connection_changed.emit(instance.url, True)
             logger.info(f"Connected to remote instance: {instance.url}")
@@ -258,14 +377,29 @@ class RemoteControlClient(QtCore.QObject):
             with self._lock:
                 self._connections.pop(instance.url, None)
                 self._connected.discard(instance.url)
+                self._rebuild_connection_snapshot()
             self.connection_changed.emit(instance.url, False)
 
-    def _schedule_reconnect(self):
-        """Schedule a reconnection attempt."""
-        if self._loop:
-            # Close existing connections to trigger reconnect
-            with self._lock:
-                for url in list(self._connections.keys()):
-                    ws = self._connections.get(url)
-                    if ws:
-                        asyncio.run_coroutine_threadsafe(ws.close(), self._loop)
+    def _rebuild_connection_snapshot(self):
+        """Publish the open connections for lock-free broadcasting. Call with the lock held."""
+        self._connection_snapshot = tuple(
+            (url, ws) for url, ws in self._connections.items() if ws and url in self._connected
+        )
+
+    def _reconnect(self, instances: List[RemoteInstance]):
+        """Close the connections of the given instances and let the manager reconnect."""
+        loop = self._loop
+        event = self._instances_changed
+        if not loop or not event:
+            return
+
+        with self._lock:
+            sockets = [self._connections.get(instance.url) for instance in instances]
+        try:
+            for ws in sockets:
+                if ws:
+                    asyncio.run_coroutine_threadsafe(ws.close(), loop)
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            # loop closed while stopping
+            pass
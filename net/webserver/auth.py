@@ -3,11 +3,23 @@ HTTP Basic Authentication handler for the Restim Web UI server.
 """
 
 import base64
+import hmac
 import logging
 
 logger = logging.getLogger('restim.webserver.auth')
 
 
+def check_credentials(provided_user: str, provided_pass: str, username: str, password: str) -> bool:
+    """
+    Compare provided credentials against the expected ones in constant time.
+
+    Both comparisons always run, so the response time does not reveal which part was wrong.
+    """
+    user_ok = hmac.compare_digest(provided_user.encode('utf-8'), username.encode('utf-8'))
+    pass_ok = hmac.compare_digest(provided_pass.encode('utf-8'), password.encode('utf-8'))
+    return user_ok & pass_ok
+
+
 def check_basic_auth(auth_header: str, username: str, password: str) -> bool:
     """
     Validate HTTP Basic Auth header.
@@ -23,17 +35,24 @@ def check_basic_auth(auth_header: str, username: str, password: str) -> bool:
     if not password:
         return True
 
-    if not auth_header or not auth_header.startswith('Basic '):
+    if not auth_header:
+        return False
+
+    # The scheme is case-insensitive, whitespace may follow it (RFC 7617)
+    scheme, _, token = auth_header.strip().partition(' ')
+    if scheme.lower() != 'basic':
         return False
 
     try:
-        credentials = base64.b64decode(auth_header[6:]).decode('utf-8')
+        # Non-ASCII input, like the surrogates http.server decodes invalid bytes to, raises ValueError
+        credentials = base64.b64decode(token.strip()).decode('utf-8')
         provided_user, provided_pass = credentials.split(':', 1)
-        return provided_user == username and provided_pass == password
-    except Exception as e:
+    except ValueError as e:
         logger.debug(f"Auth decode failed: {e}")
         return False
 
+    return check_credentials(provided_user, provided_pass, username, password)
+
 
 def create_auth_challenge_headers() -> dict:
     """Create headers for 401 Unauthorized response."""
@@ -8,6 +8,7 @@ import logging
 import time
 from typing import Optional, TYPE_CHECKING
 
+from qt_ui.device_wizard.enums import DeviceConfiguration
 from .protocol import Message, MessageType, InvalidMessageException
 
 if TYPE_CHECKING:
@@ -16,13 +17,41 @@ if TYPE_CHECKING:
 logger = logging.getLogger('restim.webserver.handlers')
 
 
+def _clamp_unit(value) -> float:
+    """Convert value to float and clamp it to [-1, 1]."""
+    value = float(value)
+    return -1.0 if value < -1.0 else 1.0 if value > 1.0 else value
+
+
 class WebSocketHandler:
     """
     Handles WebSocket messages and translates them to MainWindow actions.
     """
 
     def __init__(self, main_window: 'Window'):
+        # qt_ui.mainwindow imports this package, import it once per handler instead of per call
+        from qt_ui.mainwindow import PlayState
+        self._PlayState = PlayState
+
         self.main_window = main_window
+        # Widgets and axes used by the handlers, they live as long as the main window
+        self._alpha = main_window.alpha
+        self._beta = main_window.beta
+        self._gamma = main_window.gamma
+        self._vib = main_window.tab_vibrate
+        self._pulse = main_window.tab_pulse_settings
+        self._tp = main_window.tab_threephase
+        self._fp = main_window.tab_fourphase
+        # Widget backed part of the state, valid while main_window.state_revision is unchanged
+        self._cached_settings_state: Optional[dict] = None
+        self._cached_revision = -1
+        # Pattern names, rebuilt after the pattern combobox model changes
+        self._cached_patterns: Optional[list] = None
+        model = main_window.comboBox_patternSelect.model()
+        model.modelReset.connect(self._invalidate_patterns)
+        model.rowsInserted.connect(self._invalidate_patterns)
+        model.rowsRemoved.connect(self._invalidate_patterns)
+        model.dataChanged.connect(self._invalidate_patterns)
 
     def handle_message(self, message: Message) -> Optional[Message]:
         """
@@ -34,23 +63,10 @@ class WebSocketHandler:
         Returns:
             Optional response message, or None if no response needed
         """
-        handlers = {
-            MessageType.GET_STATE: self._handle_get_state,
-            MessageType.SET_POSITION: self._handle_set_position,
-            MessageType.SET_VOLUME: self._handle_set_volume,
-            MessageType.SET_CARRIER: self._handle_set_carrier,
-            MessageType.SET_PULSE_PARAMS: self._handle_set_pulse_params,
-            MessageType.SET_VIBRATION: self._handle_set_vibration,
-            MessageType.SET_PATTERN: self._handle_set_pattern,
-            MessageType.SET_CALIBRATION: self._handle_set_calibration,
-            MessageType.PLAY: self._handle_play,
-            MessageType.STOP: self._handle_stop,
-        }
-
-        handler = handlers.get(message.type)
+        handler = self._HANDLERS.get(message.type)
         if handler:
             try:
-                return handler(message.payload)
+                return handler(self, message.payload)
             except Exception as e:
                 logger.exception(f"Error handling message {message.type}: {e}")
                 return Message(MessageType.ERROR, {"error": str(e)})
@@ -62,33 +78,50 @@ class WebSocketHandler:
         return Message(MessageType.STATE_UPDATE, self.get_full_state())
 
     def get_full_state(self) -> dict:
-        """Collect the full application state."""
-        from qt_ui.mainwindow import PlayState
-        from qt_ui.device_wizard.enums import DeviceConfiguration
+        """
+        Collect the full application state.
 
+        The carrier, pulse, pattern and device parts are shared with the cache
+        and reused while state_revision is unchanged. The result is read-only,
+        callers serialize it and must not mutate it.
+        """
         mw = self.main_window
-        config = DeviceConfiguration.from_settings()
+
+        revision = mw.state_revision
+        if revision != self._cached_revision or self._cached_settings_state is None:
+            self._cached_settings_state = self._get_settings_state()
+            self._cached_revision = revision
+        settings_state = self._cached_settings_state
 
         return {
             "playState": mw.playstate.name,
-            "position": {
-                "alpha": mw.alpha.last_value(),
-                "beta": mw.beta.last_value(),
-                "gamma": mw.gamma.last_value(),
-            },
+            "position": self.get_position_update(),
             "volume": {
-                "master": mw.doubleSpinBox_volume.value(),
+                "master": settings_state["volume_master"],
                 "effective": mw.tab_volume.axis_master_volume.last_value() * 100,
             },
+            "carrier": settings_state["carrier"],
+            "pulse": settings_state["pulse"],
+            "vibration": self._get_vibration_params(),
+            "pattern": settings_state["pattern"],
+            "calibration": self._get_calibration_params(),
+            "device": settings_state["device"],
+        }
+
+    def _get_settings_state(self) -> dict:
+        """Collect the state that only changes when main_window.state_revision changes."""
+        mw = self.main_window
+        config = DeviceConfiguration.from_settings()
+
+        return {
+            "volume_master": mw.doubleSpinBox_volume.value(),
             "carrier": self._get_carrier_value(),
             "pulse": self._get_pulse_params(),
-            "vibration": self._get_vibration_params(),
             "pattern": {
                 "name": mw.comboBox_patternSelect.currentText(),
                 "velocity": mw.doubleSpinBox.value(),
                 "available": self._get_available_patterns(),
             },
-            "calibration": self._get_calibration_params(),
             "device": {
                 "type": config.device_type.name,
                 "waveformType": config.waveform_type.name,
@@ -101,7 +134,7 @@ class WebSocketHandler:
 
     def _get_pulse_params(self) -> dict:
         """Get current pulse parameters."""
-        ps = self.main_window.tab_pulse_settings
+        ps = self._pulse
         return {
             "carrier": ps.carrier.value(),
             "frequency": ps.pulse_freq_slider.value(),
@@ -112,7 +145,7 @@ class WebSocketHandler:
 
     def _get_vibration_params(self) -> dict:
         """Get current vibration parameters."""
-        vib = self.main_window.tab_vibrate
+        vib = self._vib
         return {
             "vibration1": {
                 "enabled": vib.vib1_gb.isChecked(),
@@ -134,16 +167,18 @@ class WebSocketHandler:
 
     def _get_available_patterns(self) -> list:
         """Get list of available pattern names."""
-        patterns = []
-        cb = self.main_window.comboBox_patternSelect
-        for i in range(cb.count()):
-            patterns.append(cb.itemText(i))
-        return patterns
+        if self._cached_patterns is None:
+            cb = self.main_window.comboBox_patternSelect
+            self._cached_patterns = [cb.itemText(i) for i in range(cb.count())]
+        return self._cached_patterns
+
+    def _invalidate_patterns(self, *args):
+        self._cached_patterns = None
 
     def _get_calibration_params(self) -> dict:
         """Get current calibration parameters."""
-        tp = self.main_window.tab_threephase
-        fp = self.main_window.tab_fourphase
+        tp = self._tp
+        fp = self._fp
         return {
             "threephase": {
                 "neutral": tp.calibrate_params.neutral.last_value(),
@@ -167,26 +202,23 @@ class WebSocketHandler:
     def _handle_set_position(self, payload: dict) -> Optional[Message]:
         """Set position (alpha, beta, gamma)."""
         interval = payload.get("interval", 0.1)
-        mw = self.main_window
 
         if "alpha" in payload:
-            value = max(-1.0, min(1.0, float(payload["alpha"])))
-            mw.alpha.add(value, interval)
+            self._alpha.add(_clamp_unit(payload["alpha"]), interval)
 
         if "beta" in payload:
-            value = max(-1.0, min(1.0, float(payload["beta"])))
-            mw.beta.add(value, interval)
+            self._beta.add(_clamp_unit(payload["beta"]), interval)
 
         if "gamma" in payload:
-            value = max(-1.0, min(1.0, float(payload["gamma"])))
-            mw.gamma.add(value, interval)
+            self._gamma.add(_clamp_unit(payload["gamma"]), interval)
 
         return None
 
     def _handle_set_volume(self, payload: dict) -> Optional[Message]:
         """Set master volume."""
         if "value" in payload:
-            value = max(0.0, min(100.0, float(payload["value"])))
+            value = float(payload["value"])
+            value = 0.0 if value < 0.0 else 100.0 if value > 100.0 else value
             self.main_window.doubleSpinBox_volume.setValue(value)
         return None
 
@@ -195,12 +227,12 @@ class WebSocketHandler:
         if "frequency" in payload:
             freq = float(payload["frequency"])
             self.main_window.tab_carrier.carrier.setValue(freq)
-            self.main_window.tab_pulse_settings.carrier.setValue(freq)
+            self._pulse.carrier.setValue(freq)
         return None
 
     def _handle_set_pulse_params(self, payload: dict) -> Optional[Message]:
         """Set pulse parameters."""
-        ps = self.main_window.tab_pulse_settings
+        ps = self._pulse
 
         if "carrier" in payload:
             ps.carrier.setValue(float(payload["carrier"]))
@@ -222,7 +254,7 @@ class WebSocketHandler:
     def _handle_set_vibration(self, payload: dict) -> Optional[Message]:
         """Set vibration parameters."""
         channel = payload.get("channel", 1)
-        vib = self.main_window.tab_vibrate
+        vib = self._vib
 
         if channel == 1:
             gb = vib.vib1_gb
@@ -281,8 +313,8 @@ class WebSocketHandler:
 
     def _handle_set_calibration(self, payload: dict) -> Optional[Message]:
         """Set calibration parameters."""
-        tp = self.main_window.tab_threephase
-        fp = self.main_window.tab_fourphase
+        tp = self._tp
+        fp = self._fp
 
         if "threephase" in payload:
             tp_data = payload["threephase"]
@@ -310,29 +342,68 @@ class WebSocketHandler:
 
     def _handle_play(self, payload: dict) -> Optional[Message]:
         """Start signal output."""
-        from qt_ui.mainwindow import PlayState
-
-        if self.main_window.playstate == PlayState.STOPPED:
+        if self.main_window.playstate == self._PlayState.STOPPED:
             self.main_window.signal_start()
         return None
 
     def _handle_stop(self, payload: dict) -> Optional[Message]:
         """Stop signal output."""
-        from qt_ui.mainwindow import PlayState
-
+        PlayState = self._PlayState
         if self.main_window.playstate != PlayState.STOPPED:
             self.main_window.signal_stop(PlayState.STOPPED)
         return None
 
     def get_position_update(self) -> dict:
         """Get current position for broadcast."""
+        return {
+            "alpha": self._alpha.last_value(),
+            "beta": self._beta.last_value(),
+            "gamma": self._gamma.last_value(),
+        }
+
+    def get_volume_update(self) -> dict:
+        """Get volume for a VOLUME_UPDATE broadcast."""
         mw = self.main_window
         return {
-            "alpha": mw.alpha.last_value(),
-            "beta": mw.beta.last_value(),
-            "gamma": mw.gamma.last_value(),
+            "master": mw.doubleSpinBox_volume.value(),
+            "effective": mw.tab_volume.axis_master_volume.last_value() * 100,
         }
 
+    def get_carrier_update(self) -> dict:
+        """Get carrier frequency for a CARRIER_UPDATE broadcast."""
+        return {"frequency": self._get_carrier_value()}
+
+    def get_pulse_update(self) -> dict:
+        """Get pulse parameters for a PULSE_UPDATE broadcast."""
+        return self._get_pulse_params()
+
+    def get_pattern_update(self) -> dict:
+        """Get pattern name and velocity for a PATTERN_UPDATE broadcast."""
+        mw = self.main_window
+        return {
+            "name": mw.comboBox_patternSelect.currentText(),
+            "velocity": mw.doubleSpinBox.value(),
+        }
+
+    def get_vibration_update(self) -> dict:
+        """Get vibration parameters for a VIBRATION_UPDATE broadcast."""
+        return self._get_vibration_params()
+
     def get_play_state(self) -> str:
         """Get current play state name."""
         return self.main_window.playstate.name
+
+    # Command message type -> handler, built once for all instances.
+    # Members are singletons and str caches its hash, so a lookup hashes nothing.
+    _HANDLERS = {
+        MessageType.GET_STATE: _handle_get_state,
+        MessageType.SET_POSITION: _handle_set_position,
+        MessageType.SET_VOLUME: _handle_set_volume,
+        MessageType.SET_CARRIER: _handle_set_carrier,
+        MessageType.SET_PULSE_PARAMS: _handle_set_pulse_params,
+        MessageType.SET_VIBRATION: _handle_set_vibration,
+        MessageType.SET_PATTERN: _handle_set_pattern,
+        MessageType.SET_CALIBRATION: _handle_set_calibration,
+        MessageType.PLAY: _handle_play,
+        MessageType.STOP: _handle_stop,
+    }
@@ -7,14 +7,51 @@ All messages use JSON format with consistent structure:
     "payload": { ... },
     "timestamp": 1234567890.123
 }
+
+Broadcasts from the server are batched: one WebSocket frame may contain a
+JSON array of such messages. All messages from the server are sent as text
+frames. The server accepts commands in both text and binary frames.
 """
 
 from enum import Enum
 from dataclasses import dataclass, field
-from typing import Any, Optional
+from typing import Any, Optional, Union
 import json
 import time
 
+# orjson is optional, it parses and serializes messages much faster than json.
+# dumps() returns whatever the serializer produces, bytes from orjson and str
+# from json, so it is never transcoded for receivers that take either.
+# dumps_text() always returns str.
+# orjson.JSONDecodeError is a subclass of json.JSONDecodeError.
+try:
+    import orjson
+
+    def _orjson_default(obj):
+        # float/int subclasses that orjson doesn't handle natively
+        if isinstance(obj, float):
+            return float(obj)
+        if isinstance(obj, int):
+            return int(obj)
+        raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+    def dumps(obj) -> bytes:
+        """Serialize obj to UTF-8 encoded JSON."""
+        return orjson.dumps(obj, default=_orjson_default, option=orjson.OPT_SERIALIZE_NUMPY)
+
+    def dumps_text(obj) -> str:
+        """Serialize obj to JSON text, for text frames."""
+        return dumps(obj).decode('utf-8')
+
+    loads = orjson.loads
+except ImportError:
+    def dumps_text(obj) -> str:
+        """Serialize obj to JSON text, for text frames."""
+        return json.dumps(obj)
+
+    dumps = dumps_text
+    loads = json.loads
+
 
 class MessageType(str, Enum):
     # Client -> Server (Commands)
@@ -53,17 +90,21 @@ class Message:
         if self.timestamp is None:
             self.timestamp = time.time()
 
-    def to_json(self) -> str:
-        return json.dumps({
-            "type": self.type.value if isinstance(self.type, MessageType) else self.type,
+    def to_dict(self) -> dict:
+        return {
+            # MessageType members are str, they serialize as their value
+            "type": self.type,
             "payload": self.payload,
             "timestamp": self.timestamp
-        })
+        }
+
+    def to_json(self) -> str:
+        return dumps_text(self.to_dict())
 
     @classmethod
-    def from_json(cls, data: str) -> 'Message':
+    def from_json(cls, data: Union[str, bytes]) -> 'Message':
         try:
-            obj = json.loads(data)
+            obj = loads(data)
             return cls(
                 type=MessageType(obj["type"]),
                 payload=obj.get("payload", {}),
@@ -73,6 +114,19 @@ class Message:
             raise InvalidMessageException(f"Failed to parse message: {e}")
 
 
+def encode_position(alpha: float, beta: float, gamma: float, timestamp: float) -> str:
+    """
+    Encode a POSITION_UPDATE message without building a Message.
+
+    Equivalent to Message(MessageType.POSITION_UPDATE, {...}).to_json(), with
+    the position rounded to 4 decimals and the timestamp to milliseconds.
+    """
+    return (
+        f'{{"type":"position_update","payload":{{"alpha":{alpha:.4f},"beta":{beta:.4f},'
+        f'"gamma":{gamma:.4f}}},"timestamp":{timestamp:.3f}}}'
+    )
+
+
 class InvalidMessageException(Exception):
     """Raised when a message cannot be parsed or is invalid."""
     pass
@@ -7,15 +7,22 @@ communication. Runs in a separate thread with asyncio event loop.
 
 import asyncio
 import base64
-import json
+import collections
+import gzip
+import hashlib
 import logging
 import mimetypes
 import os
+import queue
+import socket
 import threading
+import time
+import urllib.parse
 import weakref
 from http import HTTPStatus
-from http.server import HTTPServer, SimpleHTTPRequestHandler
-from typing import Optional, Set, TYPE_CHECKING
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Set, Tuple, Union, TYPE_CHECKING
 
 import websockets
 from websockets.server import serve as websocket_serve, WebSocketServerProtocol
@@ -24,15 +31,102 @@ from PySide6 import QtCore
 
 from qt_ui import settings
 from qt_ui.resources import resource_path
-from .auth import check_basic_auth, create_auth_challenge_headers
+from .auth import check_basic_auth, check_credentials, create_auth_challenge_headers
 from .handlers import WebSocketHandler
-from .protocol import Message, MessageType, InvalidMessageException
+from .protocol import Message, MessageType, InvalidMessageException, dumps_text, loads, encode_position
 
 if TYPE_CHECKING:
     from qt_ui.mainwindow import Window
 
 logger = logging.getLogger('restim.webserver')
 
+# Broadcast packets are collected and sent as one JSON array per interval
+BROADCAST_FLUSH_INTERVAL = 0.033
+# Flush early if this many packets are pending
+BROADCAST_MAX_PENDING = 64
+# Heartbeat, clients that don't answer a ping in time are disconnected
+WS_PING_INTERVAL = 20
+WS_PING_TIMEOUT = 10
+# Position changes smaller than this on every axis are not broadcast
+POSITION_EPSILON = 1e-4
+
+
+def _set_nodelay(sock: Optional[socket.socket]):
+    """
+    Disable Nagle's algorithm so small writes are sent immediately.
+
+    Used for the HTTP request sockets. asyncio already sets TCP_NODELAY on
+    the WebSocket transports.
+    """
+    if sock is None or sock.family not in (socket.AF_INET, socket.AF_INET6):
+        return
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except OSError as e:
+        logger.debug(f"Failed to set TCP_NODELAY: {e}")
+
+
+@dataclass(frozen=True)
+class _StaticFile:
+    """A web UI file held in memory, with its gzip encoded variant."""
+    data: bytes
+    gzip_data: bytes
+    etag: str
+    content_type: str
+
+
+def _load_static_files(directory: str) -> Dict[str, _StaticFile]:
+    """Read and compress all files below directory, keyed by URL path."""
+    files = {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            url_path = '/' + os.path.relpath(path, directory).replace(os.sep, '/')
+            content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            files[url_path] = _StaticFile(
+                data=data,
+                gzip_data=gzip.compress(data, mtime=0),
+                etag='"' + hashlib.sha1(data).hexdigest() + '"',
+                content_type=content_type,
+            )
+    return files
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an Accept-Encoding header value allows gzip, honoring q=0."""
+    gzip_q = None
+    wildcard_q = None
+    for item in accept_encoding.split(','):
+        coding, *params = item.split(';')
+        coding = coding.strip().lower()
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding in ('gzip', 'x-gzip'):
+            gzip_q = q
+        elif coding == '*':
+            wildcard_q = q
+
+    if gzip_q is None:
+        gzip_q = wildcard_q
+    return gzip_q is not None and gzip_q > 0
+
+
+class _NoDelayHTTPServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer that disables Nagle's algorithm on accepted connections."""
+
+    def get_request(self):
+        request, client_address = super().get_request()
+        _set_nodelay(request)
+        return request, client_address
+
 
 class WebUIServer(QtCore.QObject):
     """
@@ -51,10 +145,32 @@ class WebUIServer(QtCore.QObject):
         self._handler: Optional[WebSocketHandler] = None
         self._thread: Optional[threading.Thread] = None
         self._loop: Optional[asyncio.AbstractEventLoop] = None
-        self._http_server: Optional[HTTPServer] = None
+        self._http_server: Optional[ThreadingHTTPServer] = None
+        # Guards publishing _http_server against stop() taking it, so a published
+        # server always reaches serve_forever() and its shutdown() returns
+        self._http_server_lock = threading.Lock()
         self._ws_server = None
         self._ws_clients: Set[WebSocketServerProtocol] = set()
+        # Immutable copy of _ws_clients, replaced when membership changes.
+        # Broadcasts iterate it without copying, other threads may read it.
+        self._ws_clients_snapshot: Tuple[WebSocketServerProtocol, ...] = ()
+        # Packets waiting for the next broadcast flush, only touched on the event loop
+        # Each packet is serialized to JSON text when queued, the flush only joins them
+        self._pending: list = []
+        # Last position handed to the event loop, only touched on the Qt thread
+        self._last_position: Optional[tuple] = None
+        # (function, argument) pairs put by the Qt thread, applied on the event loop at each flush
+        self._outbound_q: queue.SimpleQueue = queue.SimpleQueue()
+        # Latest position put by the Qt thread, older samples are overwritten
+        self._position_ring: collections.deque = collections.deque(maxlen=1)
+        # Pending flush, only touched on the event loop. Armed when something is
+        # queued, so an idle server doesn't wake up.
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # Set by the Qt thread once it asked the event loop for a flush, cleared by the flush
+        self._flush_requested = False
         self._running = False
+        # Set from stop() to end _serve, created on the event loop thread
+        self._stop_event: Optional[asyncio.Event] = None
         self._broadcast_timer: Optional[QtCore.QTimer] = None
 
         # Start server if enabled
@@ -65,6 +181,14 @@ class WebUIServer(QtCore.QObject):
     def main_window(self) -> Optional['Window']:
         return self._main_window_ref()
 
+    def refreshSettings(self):
+        """Start or stop the servers when the enabled setting changed."""
+        enabled = settings.webui_enabled.get()
+        if enabled and not self._running:
+            self._start()
+        elif not enabled and self._running:
+            self.stop()
+
     def _start(self):
         """Start the HTTP and WebSocket servers in a background thread."""
         if self._running:
@@ -99,8 +223,15 @@ class WebUIServer(QtCore.QObject):
             self._broadcast_timer.stop()
             self._broadcast_timer = None
 
-        if self._loop:
-            self._loop.call_soon_threadsafe(self._loop.stop)
+        # Cleared so a restart never shuts down the old server again
+        with self._http_server_lock:
+            http_server, self._http_server = self._http_server, None
+        if http_server:
+            # shutdown() waits for the next serve_forever() poll, don't block the Qt thread on it
+            threading.Thread(target=http_server.shutdown, daemon=True).start()
+
+        if self._loop and self._stop_event:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
 
         if self._thread and self._thread.is_alive():
             self._thread.join(timeout=2.0)
@@ -109,8 +240,11 @@ class WebUIServer(QtCore.QObject):
 
     def _run_event_loop(self, host: str, port: int):
         """Run asyncio event loop in background thread."""
+        self._flush_handle = None
+        self._flush_requested = False
         self._loop = asyncio.new_event_loop()
         asyncio.set_event_loop(self._loop)
+        self._stop_event = asyncio.Event()
 
         try:
             self._loop.run_until_complete(self._serve(host, port))
@@ -135,6 +269,11 @@ class WebUIServer(QtCore.QObject):
                 ws_handler,
                 host,
                 ws_port,
+                ping_interval=WS_PING_INTERVAL,
+                ping_timeout=WS_PING_TIMEOUT,
+                # No permessage-deflate: messages are small JSON, compressing them
+                # per client costs more CPU than it saves on the wire
+                compression=None,
             )
             logger.info(f"WebSocket server listening on ws://{host}:{ws_port}")
         except Exception as e:
@@ -152,8 +291,8 @@ class WebUIServer(QtCore.QObject):
         )
 
         # Keep running until stopped
-        while self._running:
-            await asyncio.sleep(0.1)
+        if self._running:
+            await self._stop_event.wait()
 
         # Cleanup
         if self._ws_server:
@@ -161,14 +300,17 @@ class WebUIServer(QtCore.QObject):
             await self._ws_server.wait_closed()
 
     def _run_http_server(self, host: str, port: int, username: str, password: str):
-        """Run HTTP server for static files."""
-        webui_dir = resource_path('resources/webui')
-
-        class AuthHandler(SimpleHTTPRequestHandler):
-            def __init__(self, *args, directory=None, **kwargs):
-                super().__init__(*args, directory=webui_dir, **kwargs)
+        """Run HTTP server for static files, served from memory."""
+        static_files = _load_static_files(resource_path('resources/webui'))
 
+        class AuthHandler(BaseHTTPRequestHandler):
             def do_GET(self):
+                self._send_static_file(send_body=True)
+
+            def do_HEAD(self):
+                self._send_static_file(send_body=False)
+
+            def _send_static_file(self, send_body: bool):
                 # Check authentication
                 auth_header = self.headers.get('Authorization', '')
                 if not check_basic_auth(auth_header, username, password):
@@ -176,30 +318,65 @@ class WebUIServer(QtCore.QObject):
                     for key, value in create_auth_challenge_headers().items():
                         self.send_header(key, value)
                     self.end_headers()
-                    self.wfile.write(b'Unauthorized')
+                    if send_body:
+                        self.wfile.write(b'Unauthorized')
                     return
 
                 # Serve index.html for root
-                if self.path == '/':
-                    self.path = '/index.html'
+                path = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path)
+                if path == '/':
+                    path = '/index.html'
 
-                super().do_GET()
+                static_file = static_files.get(path)
+                if static_file is None:
+                    self.send_error(HTTPStatus.NOT_FOUND)
+                    return
+
+                if self.headers.get('If-None-Match') == static_file.etag:
+                    self.send_response(HTTPStatus.NOT_MODIFIED)
+                    self.send_header('ETag', static_file.etag)
+                    self.end_headers()
+                    return
+
+                use_gzip = _accepts_gzip(self.headers.get('Accept-Encoding', ''))
+                body = static_file.gzip_data if use_gzip else static_file.data
+
+                self.send_response(HTTPStatus.OK)
+                self.send_header('Content-Type', static_file.content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', static_file.etag)
+                self.send_header('Cache-Control', 'no-cache')
+                # Sent with both variants, caches must key on Accept-Encoding either way
+                self.send_header('Vary', 'Accept-Encoding')
+                if use_gzip:
+                    self.send_header('Content-Encoding', 'gzip')
+                self.end_headers()
+                if send_body:
+                    self.wfile.write(body)
 
             def log_message(self, format, *args):
-                logger.debug(f"HTTP: {format % args}")
+                logger.debug("HTTP: " + format, *args)
 
+        http_server = None
         try:
-            self._http_server = HTTPServer((host, port), AuthHandler)
+            http_server = _NoDelayHTTPServer((host, port), AuthHandler)
+            # Not published if stop() already ran, nothing would shut it down.
+            # Once published it is always served, a pending shutdown() ends it at once.
+            with self._http_server_lock:
+                if not self._running:
+                    return
+                self._http_server = http_server
             logger.info(f"HTTP server listening on http://{host}:{port}")
-
-            while self._running:
-                self._http_server.handle_request()
+            http_server.serve_forever(poll_interval=0.5)
 
         except Exception as e:
             logger.error(f"HTTP server error: {e}")
         finally:
-            if self._http_server:
-                self._http_server.server_close()
+            if http_server:
+                http_server.server_close()
+                with self._http_server_lock:
+                    if self._http_server is http_server:
+                        self._http_server = None
 
     async def _handle_websocket(self, websocket: WebSocketServerProtocol, path: str,
                                  username: str, password: str):
@@ -212,12 +389,12 @@ class WebUIServer(QtCore.QObject):
                 # Wait for auth message
                 try:
                     auth_msg = await asyncio.wait_for(websocket.recv(), timeout=10.0)
-                    auth_data = json.loads(auth_msg)
+                    auth_data = loads(auth_msg)
                     if auth_data.get('type') == 'auth':
                         provided_user = auth_data.get('username', '')
                         provided_pass = auth_data.get('password', '')
-                        if provided_user != username or provided_pass != password:
-                            await websocket.send(json.dumps({
+                        if not check_credentials(provided_user, provided_pass, username, password):
+                            await websocket.send(dumps_text({
                                 "type": "error",
                                 "payload": {"error": "Invalid credentials"}
                             }))
@@ -235,7 +412,7 @@ class WebUIServer(QtCore.QObject):
                     return
 
         # Add to connected clients
-        self._ws_clients.add(websocket)
+        self._add_client(websocket)
         logger.info(f"WebSocket client connected: {websocket.remote_address}")
 
         try:
@@ -247,7 +424,7 @@ class WebUIServer(QtCore.QObject):
                 })
                 await websocket.send(welcome.to_json())
 
-                # Send full state
+                # Send full state, later changes arrive as narrow updates
                 state = Message(MessageType.STATE_UPDATE, self._handler.get_full_state())
                 await websocket.send(state.to_json())
 
@@ -260,9 +437,9 @@ class WebUIServer(QtCore.QObject):
         except Exception as e:
             logger.exception(f"WebSocket error: {e}")
         finally:
-            self._ws_clients.discard(websocket)
+            self._remove_client(websocket)
 
-    async def _process_message(self, websocket: WebSocketServerProtocol, raw_message: str):
+    async def _process_message(self, websocket: WebSocketServerProtocol, raw_message: Union[str, bytes]):
         """Process an incoming WebSocket message."""
         if not self._handler:
             return
@@ -274,11 +451,11 @@ class WebUIServer(QtCore.QObject):
             if response:
                 await websocket.send(response.to_json())
 
-            # Broadcast state changes to all clients
-            if message.type in (MessageType.SET_VOLUME, MessageType.SET_CARRIER,
-                               MessageType.SET_PULSE_PARAMS, MessageType.SET_PATTERN,
-                               MessageType.SET_VIBRATION, MessageType.PLAY, MessageType.STOP):
-                await self._broadcast_state_update()
+            # Broadcast only the part of the state the command changed
+            update = self._NARROW_UPDATES.get(message.type)
+            if update:
+                update_type, builder = update
+                self._queue_broadcast(Message(update_type, builder(self._handler)))
 
         except InvalidMessageException as e:
             error = Message(MessageType.ERROR, {"error": str(e)})
@@ -288,56 +465,139 @@ class WebUIServer(QtCore.QObject):
             error = Message(MessageType.ERROR, {"error": "Internal error"})
             await websocket.send(error.to_json())
 
-    async def _broadcast_state_update(self):
-        """Broadcast full state to all connected clients."""
-        if not self._handler or not self._ws_clients:
+    def _add_client(self, websocket: WebSocketServerProtocol):
+        """Register a connected client. Runs on the event loop."""
+        self._ws_clients.add(websocket)
+        self._ws_clients_snapshot = tuple(self._ws_clients)
+
+    def _remove_client(self, websocket: WebSocketServerProtocol):
+        """Unregister a client. Runs on the event loop."""
+        if websocket in self._ws_clients:
+            self._ws_clients.discard(websocket)
+            self._ws_clients_snapshot = tuple(self._ws_clients)
+
+    def _queue_broadcast(self, message: Message):
+        """Add a message to the next broadcast batch. Runs on the event loop."""
+        if not self._ws_clients_snapshot:
+            return
+
+        self._queue_packet(message.to_json())
+
+    def _queue_packet(self, packet: str):
+        """Add a serialized message to the next broadcast batch. Runs on the event loop."""
+        if not self._pending:
+            self._arm_flush()
+        self._pending.append(packet)
+        if len(self._pending) >= BROADCAST_MAX_PENDING:
+            self._send_pending()
+
+    def _queue_position(self, position: dict):
+        """Queue a position update. Runs on the event loop."""
+        if not self._ws_clients_snapshot:
+            return
+
+        self._queue_packet(encode_position(position["alpha"], position["beta"], position["gamma"],
+                                           time.time()))
+
+    def _send_pending(self):
+        """Send all pending packets as a single frame. Runs on the event loop."""
+        if not self._pending:
             return
 
-        state = Message(MessageType.STATE_UPDATE, self._handler.get_full_state())
-        message = state.to_json()
+        batch, self._pending = self._pending, []
+        # Joined into a JSON array once, every client is sent the same text frame
+        asyncio.ensure_future(self._broadcast_to_all('[' + ','.join(batch) + ']'))
 
-        for client in list(self._ws_clients):
+    def _drain_outbound(self):
+        """Queue everything the Qt thread has put in _outbound_q. Runs on the event loop."""
+        try:
+            self._queue_position(self._position_ring.pop())
+        except IndexError:
+            pass
+
+        while True:
             try:
-                await client.send(message)
-            except Exception:
+                func, arg = self._outbound_q.get_nowait()
+            except queue.Empty:
+                return
+            func(arg)
+
+    def _arm_flush(self):
+        """Schedule a broadcast flush unless one is pending. Runs on the event loop."""
+        if self._flush_handle is None and self._running:
+            self._flush_handle = self._loop.call_later(BROADCAST_FLUSH_INTERVAL, self._flush_pending)
+
+    def _request_flush(self):
+        """
+        Ask the event loop for a flush after putting to _outbound_q or _position_ring.
+        Runs on the Qt thread, wakes the event loop at most once per flush.
+        """
+        if not self._flush_requested:
+            self._flush_requested = True
+            try:
+                self._loop.call_soon_threadsafe(self._arm_flush)
+            except RuntimeError:
+                # The event loop was closed by stop()
                 pass
 
+    def _flush_pending(self):
+        """Broadcast flush, armed again only when something new is queued."""
+        # Cleared before draining, anything the Qt thread puts after the drain requests a new flush
+        self._flush_requested = False
+        self._drain_outbound()
+        self._send_pending()
+        # Cleared last, packets queued by the drain are sent by this flush
+        self._flush_handle = None
+
     def _broadcast_position(self):
         """Broadcast position update (called from Qt timer)."""
-        if not self._handler or not self._ws_clients or not self._loop:
+        if not self._handler or not self._ws_clients_snapshot or not self._loop:
             return
 
         position = self._handler.get_position_update()
-        message = Message(MessageType.POSITION_UPDATE, position)
-        json_msg = message.to_json()
-
-        # Schedule broadcast in asyncio loop
-        asyncio.run_coroutine_threadsafe(
-            self._broadcast_to_all(json_msg),
-            self._loop
-        )
+        key = (position["alpha"], position["beta"], position["gamma"])
+        last = self._last_position
+        if last is not None and (abs(key[0] - last[0]) < POSITION_EPSILON
+                                 and abs(key[1] - last[1]) < POSITION_EPSILON
+                                 and abs(key[2] - last[2]) < POSITION_EPSILON):
+            return
+        self._last_position = key
+        self._position_ring.append(position)
+        self._request_flush()
 
     async def _broadcast_to_all(self, message: str):
-        """Broadcast a message to all connected clients."""
-        for client in list(self._ws_clients):
-            try:
-                await client.send(message)
-            except Exception:
-                pass
+        """Broadcast a message to all connected clients concurrently."""
+        clients = self._ws_clients_snapshot
+        if not clients:
+            return
+
+        results = await asyncio.gather(*(client.send(message) for client in clients),
+                                       return_exceptions=True)
+        for client, result in zip(clients, results):
+            if isinstance(result, websockets.exceptions.ConnectionClosed):
+                self._remove_client(client)
+            elif isinstance(result, Exception):
+                logger.debug("Broadcast to %s failed: %s", client.remote_address, result)
 
     def broadcast_play_state(self, play_state):
         """Broadcast play state change (called from MainWindow)."""
-        if not self._ws_clients or not self._loop:
+        if not self._ws_clients_snapshot or not self._loop:
             return
 
         message = Message(MessageType.PLAY_STATE_UPDATE, {"state": play_state.name})
-        json_msg = message.to_json()
-
-        asyncio.run_coroutine_threadsafe(
-            self._broadcast_to_all(json_msg),
-            self._loop
-        )
+        self._outbound_q.put_nowait((self._queue_broadcast, message))
+        self._request_flush()
 
     def get_client_count(self) -> int:
         """Return number of connected WebSocket clients."""
-        return len(self._ws_clients)
+        return len(self._ws_clients_snapshot)
+
+    # Command message type -> (update message type, payload builder).
+    # PLAY and STOP are absent, MainWindow calls broadcast_play_state.
+    _NARROW_UPDATES = {
+        MessageType.SET_VOLUME: (MessageType.VOLUME_UPDATE, WebSocketHandler.get_volume_update),
+        MessageType.SET_CARRIER: (MessageType.CARRIER_UPDATE, WebSocketHandler.get_carrier_update),
+        MessageType.SET_PULSE_PARAMS: (MessageType.PULSE_UPDATE, WebSocketHandler.get_pulse_update),
+        MessageType.SET_PATTERN: (MessageType.PATTERN_UPDATE, WebSocketHandler.get_pattern_update),
+        MessageType.SET_VIBRATION: (MessageType.VIBRATION_UPDATE, WebSocketHandler.get_vibration_update),
+    }
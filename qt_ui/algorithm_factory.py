@@ -33,6 +33,8 @@ class AlgorithmFactory:
         self.media_sync = media_sync
         self.load_funscripts = load_funscripts
         self.create_for_bake = create_for_bake
+        # precomputed axes are immutable, share one per funscript axis within this factory
+        self._script_axes = {}
 
     def create_algorithm(self, device: DeviceConfiguration) -> AudioGenerationAlgorithm | NeoStimAlgorithm:
         if device.device_type == DeviceType.AUDIO_THREE_PHASE:
@@ -405,13 +407,18 @@ class AlgorithmFactory:
         if not self.load_funscripts:
             return None
 
+        if axis in self._script_axes:
+            return self._script_axes[axis]
+
         funscript_item = self.script_mapping.get_config_for_axis(axis)
         if funscript_item:
             limit_min, limit_max = self.kit.limits_for_axis(axis)
             # TODO: not very memory efficient if multiple algorithms reference the same script.
             # but worst-case it only wastes a few MB or so...
-            return create_precomputed_axis(funscript_item.script.x,
-                                           np.clip(funscript_item.script.y, 0, 1) * (limit_max - limit_min) + limit_min,
-                                           self.timestamp_mapper)
+            result = create_precomputed_axis(funscript_item.script.x,
+                                             np.clip(funscript_item.script.y, 0, 1) * (limit_max - limit_min) + limit_min,
+                                             self.timestamp_mapper)
         else:
-            return None
+            result = None
+        self._script_axes[axis] = result
+        return result
@@ -1,9 +1,11 @@
+import functools
 import os
 import sys
+import threading
 from enum import Enum
 
 from PySide6 import QtGui
-from PySide6.QtCore import QTimer
+from PySide6.QtCore import Qt, QTimer
 from PySide6.QtGui import QIcon
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QSizePolicy, QFrame, QStyleFactory
@@ -12,19 +14,11 @@ import logging
 
 from net.media_source.interface import MediaConnectionState
 from qt_ui.algorithm_factory import AlgorithmFactory
-from qt_ui.audio_write_dialog import AudioWriteDialog
 from qt_ui.main_window_ui import Ui_MainWindow
 import qt_ui.patterns.threephase_patterns
 import qt_ui.patterns.fourphase_patterns
-from device.audio.audio_stim_device import AudioStimDevice
 import net.websocketserver
 import net.tcpudpserver
-import qt_ui.funscript_conversion_dialog
-import qt_ui.simfile_conversion_dialog
-import qt_ui.focstim_flash_dialog
-import qt_ui.funscript_decomposition_dialog
-import qt_ui.preferences_dialog
-import qt_ui.about_dialog
 import qt_ui.settings
 import net.serialproxy
 import net.buttplug_wsdm_client
@@ -33,21 +27,19 @@ import net.webserver
 import net.remote_control
 from qt_ui import resources
 from qt_ui.models.funscript_kit import FunscriptKitModel
-from device.focstim.proto_device import FOCStimProtoDevice
-from device.neostim.neostim_device import NeoStim
 from qt_ui.widgets.icon_with_connection_status import IconWithConnectionStatus
 from stim_math.axis import create_temporal_axis
 
-
-import sounddevice as sd
-
-from qt_ui.device_wizard.wizard import DeviceSelectionWizard
+from qt_ui.device_wizard.axes import AxisEnum
 from qt_ui.device_wizard.enums import DeviceConfiguration, DeviceType, WaveformType
 
 from qt_ui.tcode_command_router import TCodeCommandRouter
 
 logger = logging.getLogger('restim.main')
 
+# Positions that moved less than this on every axis are not sent to remote instances again
+REMOTE_POSITION_EPSILON = 1e-3
+
 
 class PlayState(Enum):
     STOPPED = 0
@@ -60,6 +52,48 @@ class Window(QMainWindow, Ui_MainWindow):
         super().__init__(parent)
         self.setupUi(self)
 
+        # parsed from settings on first use, cleared when the wizard or preferences may have changed them
+        self._device_config_cache = None
+        self._funscript_kit_cache = None
+        # (host api name, output device name) used when the audio settings are empty
+        self._default_audio_output_cache = None
+
+        # tab index of every device dependent tab, setTabVisible() does not change the indices
+        self._tab_index = {tab: self.tabWidget.indexOf(tab) for tab in (
+            self.tab_threephase,
+            self.tab_fourphase,
+            self.tab_pulse_settings,
+            self.tab_carrier,
+            self.tab_volume,
+            self.tab_vibrate,
+            self.tab_details,
+            self.tab_a_b_testing,
+            self.tab_neostim,
+        )}
+        self._visible_tabs = None
+
+        # visible tabs for every (device type, waveform type), see refresh_device_type()
+        common_tabs = frozenset({self.tab_threephase, self.tab_volume, self.tab_vibrate, self.tab_details})
+        self._default_visible_tabs = common_tabs
+        self._visible_tabs_for = {
+            (DeviceType.AUDIO_THREE_PHASE, WaveformType.CONTINUOUS):
+                common_tabs | {self.tab_carrier},
+            (DeviceType.AUDIO_THREE_PHASE, WaveformType.PULSE_BASED):
+                common_tabs | {self.tab_pulse_settings},
+            (DeviceType.AUDIO_THREE_PHASE, WaveformType.A_B_TESTING):
+                common_tabs | {self.tab_a_b_testing},
+        }
+        for waveform_type in WaveformType:
+            self._visible_tabs_for[(DeviceType.FOCSTIM_THREE_PHASE, waveform_type)] = \
+                (common_tabs | {self.tab_pulse_settings}) - {self.tab_vibrate}
+            self._visible_tabs_for[(DeviceType.FOCSTIM_FOUR_PHASE, waveform_type)] = \
+                (common_tabs | {self.tab_pulse_settings, self.tab_fourphase}) - {self.tab_vibrate, self.tab_threephase, self.tab_details}
+            self._visible_tabs_for[(DeviceType.NEOSTIM_THREE_PHASE, waveform_type)] = \
+                (common_tabs | {self.tab_neostim}) - {self.tab_vibrate, self.tab_details}
+
+        # pattern list shown in comboBox_patternSelect
+        self._pattern_list = None
+
         self.playstate = PlayState.STOPPED
         self.tab_volume.set_play_state(self.playstate)
         self.refresh_play_button_icon()
@@ -93,34 +127,34 @@ class Window(QMainWindow, Ui_MainWindow):
         self.beta = create_temporal_axis(0.0)
         self.gamma = create_temporal_axis(0.0)
 
-        self.tcode_command_router = TCodeCommandRouter(
-            self.alpha,
-            self.beta,
-            self.gamma,
-            self.tab_volume.axis_api_volume,
-            self.tab_volume.axis_external_volume,
+        self.tcode_command_router = TCodeCommandRouter({
+            AxisEnum.POSITION_ALPHA: self.alpha,
+            AxisEnum.POSITION_BETA: self.beta,
+            AxisEnum.POSITION_GAMMA: self.gamma,
+            AxisEnum.VOLUME_API: self.tab_volume.axis_api_volume,
+            AxisEnum.VOLUME_EXTERNAL: self.tab_volume.axis_external_volume,
 
-            self.tab_carrier.axis_carrier,  # this gets set to the device-specific axis later
+            AxisEnum.CARRIER_FREQUENCY: self.tab_carrier.axis_carrier,  # this gets set to the device-specific axis later
 
-            self.tab_pulse_settings.axis_pulse_frequency,
-            self.tab_pulse_settings.axis_pulse_width,
-            self.tab_pulse_settings.axis_pulse_interval_random,
-            self.tab_pulse_settings.axis_pulse_rise_time,
+            AxisEnum.PULSE_FREQUENCY: self.tab_pulse_settings.axis_pulse_frequency,
+            AxisEnum.PULSE_WIDTH: self.tab_pulse_settings.axis_pulse_width,
+            AxisEnum.PULSE_INTERVAL_RANDOM: self.tab_pulse_settings.axis_pulse_interval_random,
+            AxisEnum.PULSE_RISE_TIME: self.tab_pulse_settings.axis_pulse_rise_time,
 
-            self.tab_vibrate.vibration_1.frequency,
-            self.tab_vibrate.vibration_1.strength,
-            self.tab_vibrate.vibration_1.left_right_bias,
-            self.tab_vibrate.vibration_1.high_low_bias,
-            self.tab_vibrate.vibration_1.random,
+            AxisEnum.VIBRATION_1_FREQUENCY: self.tab_vibrate.vibration_1.frequency,
+            AxisEnum.VIBRATION_1_STRENGTH: self.tab_vibrate.vibration_1.strength,
+            AxisEnum.VIBRATION_1_LEFT_RIGHT_BIAS: self.tab_vibrate.vibration_1.left_right_bias,
+            AxisEnum.VIBRATION_1_HIGH_LOW_BIAS: self.tab_vibrate.vibration_1.high_low_bias,
+            AxisEnum.VIBRATION_1_RANDOM: self.tab_vibrate.vibration_1.random,
 
-            self.tab_vibrate.vibration_2.frequency,
-            self.tab_vibrate.vibration_2.strength,
-            self.tab_vibrate.vibration_2.left_right_bias,
-            self.tab_vibrate.vibration_2.high_low_bias,
-            self.tab_vibrate.vibration_2.random,
+            AxisEnum.VIBRATION_2_FREQUENCY: self.tab_vibrate.vibration_2.frequency,
+            AxisEnum.VIBRATION_2_STRENGTH: self.tab_vibrate.vibration_2.strength,
+            AxisEnum.VIBRATION_2_LEFT_RIGHT_BIAS: self.tab_vibrate.vibration_2.left_right_bias,
+            AxisEnum.VIBRATION_2_HIGH_LOW_BIAS: self.tab_vibrate.vibration_2.high_low_bias,
+            AxisEnum.VIBRATION_2_RANDOM: self.tab_vibrate.vibration_2.random,
 
             # TODO: neostim
-        )
+        })
 
         # threephase view
         self.motion_3 = qt_ui.patterns.threephase_patterns.ThreephaseMotionGenerator(self, self.alpha, self.beta)
@@ -144,27 +178,59 @@ class Window(QMainWindow, Ui_MainWindow):
 
         self.comboBox_patternSelect.currentIndexChanged.connect(self.pattern_selection_changed)
         self.motion_3.set_pattern(self.comboBox_patternSelect.currentText())
-        self.doubleSpinBox.valueChanged.connect(self.motion_3.set_velocity)
-        self.doubleSpinBox.valueChanged.connect(self.motion_4.set_velocity)
-        self.motion_3.set_velocity(self.doubleSpinBox.value())
 
         self.output_device = None
 
+        # (controller, AlgorithmFactory axis getter) pairs, relinked in funscript_mapping_changed
+        self._axis_links = (
+            # continuous tab
+            (self.tab_carrier.carrier_controller, AlgorithmFactory.get_axis_continuous_carrier_frequency),
+
+            # pulse tab
+            (self.tab_pulse_settings.carrier_controller, AlgorithmFactory.get_axis_pulse_carrier_frequency),
+            (self.tab_pulse_settings.pulse_frequency_controller, AlgorithmFactory.get_axis_pulse_frequency),
+            (self.tab_pulse_settings.pulse_width_controller, AlgorithmFactory.get_axis_pulse_width),
+            (self.tab_pulse_settings.pulse_interval_random_controller, AlgorithmFactory.get_axis_pulse_interval_random),
+            (self.tab_pulse_settings.pulse_rise_time_controller, AlgorithmFactory.get_axis_pulse_rise_time),
+
+            # vibration tab
+            (self.tab_vibrate.vib1_enabled_controller, AlgorithmFactory.get_axis_vib1_enabled),
+            (self.tab_vibrate.vib1_freq_controller, AlgorithmFactory.get_axis_vib1_frequency),
+            (self.tab_vibrate.vib1_strength_controller, AlgorithmFactory.get_axis_vib1_strength),
+            (self.tab_vibrate.vib1_left_right_bias_controller, AlgorithmFactory.get_axis_vib1_left_right_bias),
+            (self.tab_vibrate.vib1_high_low_bias_controller, AlgorithmFactory.get_axis_vib1_high_low_bias),
+            (self.tab_vibrate.vib1_random_controller, AlgorithmFactory.get_axis_vib1_random),
+            (self.tab_vibrate.vib2_enabled_controller, AlgorithmFactory.get_axis_vib2_enabled),
+            (self.tab_vibrate.vib2_freq_controller, AlgorithmFactory.get_axis_vib2_frequency),
+            (self.tab_vibrate.vib2_strength_controller, AlgorithmFactory.get_axis_vib2_strength),
+            (self.tab_vibrate.vib2_left_right_bias_controller, AlgorithmFactory.get_axis_vib2_left_right_bias),
+            (self.tab_vibrate.vib2_high_low_bias_controller, AlgorithmFactory.get_axis_vib2_high_low_bias),
+            (self.tab_vibrate.vib2_random_controller, AlgorithmFactory.get_axis_vib2_random),
+        )
+
+        # T-Code commands are collected and routed once per event loop iteration
+        self._pending_tcode = []
+        self._tcode_timer = QTimer(self)
+        self._tcode_timer.setSingleShot(True)
+        self._tcode_timer.setInterval(0)
+        self._tcode_timer.timeout.connect(self._route_pending_tcode)
+
         self.websocket_server = net.websocketserver.WebSocketServer(self)
-        self.websocket_server.new_tcode_command.connect(self.tcode_command_router.route_command)
+        self.websocket_server.new_tcode_command.connect(self._enqueue_tcode)
 
         self.tcpudp_server = net.tcpudpserver.TcpUdpServer(self)
-        self.tcpudp_server.new_tcode_command.connect(self.tcode_command_router.route_command)
+        self.tcpudp_server.new_tcode_command.connect(self._enqueue_tcode)
 
         self.serial_proxy = net.serialproxy.SerialProxy(self)
-        self.serial_proxy.new_tcode_command.connect(self.tcode_command_router.route_command)
+        self.serial_proxy.new_tcode_command.connect(self._enqueue_tcode)
 
         self.buttplug_wsdm_client = net.buttplug_wsdm_client.ButtplugWsdmClient(self)
-        self.buttplug_wsdm_client.new_tcode_command.connect(self.tcode_command_router.route_command)
+        self.buttplug_wsdm_client.new_tcode_command.connect(self._enqueue_tcode)
 
         self.gamepad_handler = net.gamepad.GamepadHandler(self)
-        self.gamepad_handler.position_changed.connect(self.motion_3.mouse_event)
-        self.gamepad_handler.position_changed.connect(lambda a, b: self.motion_4.mouse_event(a, b, 0.0))
+        # only the enabled motion generator receives velocity and gamepad positions, see refresh_device_type()
+        self._wired_motion = None
+        self._wire_motion(self.motion_3)
         self.gamepad_handler.carrier_frequency_change.connect(self.gamepad_carrier_frequency_change)
         self.gamepad_handler.volume_change.connect(self.gamepad_volume_change)
         self.gamepad_handler.pulse_frequency_change.connect(self.gamepad_pulse_frequency_change)
@@ -174,6 +240,20 @@ class Window(QMainWindow, Ui_MainWindow):
         self.gamepad_handler.mute_triggered.connect(self.gamepad_mute_triggered)
         self.gamepad_handler.refreshSettings()
 
+        # Incremented whenever the web UI visible settings may have changed,
+        # lets the web UI handler reuse its state snapshot in between.
+        self.state_revision = 0
+        for signal in (self.doubleSpinBox_volume.valueChanged,
+                       self.doubleSpinBox.valueChanged,
+                       self.comboBox_patternSelect.currentIndexChanged,
+                       self.tab_carrier.carrier.valueChanged,
+                       self.tab_pulse_settings.carrier.valueChanged,
+                       self.tab_pulse_settings.pulse_freq_slider.valueChanged,
+                       self.tab_pulse_settings.pulse_width_slider.valueChanged,
+                       self.tab_pulse_settings.pulse_rise_time.valueChanged,
+                       self.tab_pulse_settings.pulse_interval_random.valueChanged):
+            signal.connect(self.bump_state_revision)
+
         self.webui_server = net.webserver.WebUIServer(self, self)
 
         # Remote control client for controlling other Restim instances
@@ -186,11 +266,8 @@ class Window(QMainWindow, Ui_MainWindow):
         self._mute_pre_volume = None
         self._is_muted = False
 
-        self.tab_volume.set_monitor_axis([
-            self.alpha,
-            self.beta,
-            self.gamma,
-        ])
+        self._last_monitor_axes = (self.alpha, self.beta, self.gamma)
+        self.tab_volume.set_monitor_axis(list(self._last_monitor_axes))
 
         # stop audio when user modifies settings in media tab
         self.page_media.dialogOpened.connect(self.signal_stop)
@@ -205,25 +282,26 @@ class Window(QMainWindow, Ui_MainWindow):
         self.tab_volume.refresh_master_volume()
         self.tab_vibrate.settings_changed()
 
-        self.wizard = DeviceSelectionWizard(self)
+        # dialogs are imported and created the first time they are opened
+        self.wizard = None
         self.actionDevice_selection_wizard.triggered.connect(self.open_setup_wizard)
 
-        self.dialog = qt_ui.funscript_conversion_dialog.FunscriptConversionDialog()
+        self.dialog = None
         self.actionFunscript_conversion.triggered.connect(self.open_funscript_conversion_dialog)
 
-        self.simfile_conversion_dialog = qt_ui.simfile_conversion_dialog.SimfileConversionDialog()
+        self.simfile_conversion_dialog = None
         self.actionSimfile_conversion.triggered.connect(self.open_simfile_conversion_dialog)
 
-        self.focstim_flash_dialog = qt_ui.focstim_flash_dialog.FocStimFlashDialog()
+        self.focstim_flash_dialog = None
         self.actionFirmware_updater.triggered.connect(self.open_focstim_flash_dialog)
 
-        self.funscript_decomposition_dialog = qt_ui.funscript_decomposition_dialog.FunscriptDecompositionDialog()
+        self.funscript_decomposition_dialog = None
         self.actionFunscript_decomposition.triggered.connect(self.open_funscript_decomposition_dialog)
 
-        self.settings_dialog = qt_ui.preferences_dialog.PreferencesDialog()
+        self.settings_dialog = None
         self.actionPreferences.triggered.connect(self.open_preferences_dialog)
 
-        self.about_dialog = qt_ui.about_dialog.AboutDialog(self)
+        self.about_dialog = None
         self.actionAbout.triggered.connect(self.open_about_dialog)
 
         self.iconMedia = IconWithConnectionStatus(self.actionMedia.icon(), self.toolBar.widgetForAction(self.actionMedia))
@@ -235,12 +313,9 @@ class Window(QMainWindow, Ui_MainWindow):
 
         self.refresh_device_type()
 
-        config = DeviceConfiguration.from_settings()
+        config = self._device_config()
         if config.device_type == DeviceType.NONE:
-            self.timer = QTimer()
-            self.timer.setSingleShot(True)
-            self.timer.timeout.connect(self.open_setup_wizard)
-            self.timer.start(0)
+            QTimer.singleShot(0, self.open_setup_wizard)
 
         self.autostart_timer = QTimer()
         self.autostart_timer.setSingleShot(True)
@@ -248,38 +323,21 @@ class Window(QMainWindow, Ui_MainWindow):
         self.autostart_timer.setInterval(5000)
 
     def connect_signals_slots_actionbar(self):
-        def uncheck():
-            self.actionControl.setChecked(False)
-            self.actionMedia.setChecked(False)
-            # self.actionDevice.setChecked(False)
-            # self.actionLog.setChecked(False)
-
-        def show_control():
-            uncheck()
-            self.actionControl.setChecked(True)
-            self.stackedWidget.setCurrentIndex(self.stackedWidget.indexOf(self.page_control))
-
-        def show_media():
-            uncheck()
-            self.actionMedia.setChecked(True)
-            self.stackedWidget.setCurrentIndex(self.stackedWidget.indexOf(self.page_media))
-
-        # def show_device():
-        #     uncheck()
-        #     self.actionDevice.setChecked(True)
-        #     self.stackedWidget.setCurrentIndex(self.stackedWidget.indexOf(self.page_device))
-
-        # def show_log():
-        #     uncheck()
-        #     self.actionLog.setChecked(True)
-        #     self.stackedWidget.setCurrentIndex(self.stackedWidget.indexOf(self.page_log))
-
-        self.actionControl.triggered.connect(show_control)
-        self.actionMedia.triggered.connect(show_media)
-        # self.actionDevice.triggered.connect(show_device)
-        # self.actionLog.triggered.connect(show_log)
+        self.actionControl.triggered.connect(
+            functools.partial(self._switch_page, self.actionControl, self.page_control))
+        self.actionMedia.triggered.connect(
+            functools.partial(self._switch_page, self.actionMedia, self.page_media))
+        # self.actionDevice.triggered.connect(
+        #     functools.partial(self._switch_page, self.actionDevice, self.page_device))
+        # self.actionLog.triggered.connect(
+        #     functools.partial(self._switch_page, self.actionLog, self.page_log))
         self.actionStart.triggered.connect(self.signal_start_stop)
 
+    def _switch_page(self, action, page):
+        for a in (self.actionControl, self.actionMedia):
+            a.setChecked(a is action)
+        self.stackedWidget.setCurrentWidget(page)
+
     def media_connection_status_changed(self, status: MediaConnectionState):
         """
         Called whenever the media connection status changes.
@@ -303,10 +361,10 @@ class Window(QMainWindow, Ui_MainWindow):
         else:
             self.signal_stop(PlayState.STOPPED)
 
-        device = DeviceConfiguration.from_settings()
+        device = self._device_config()
         algorithm_factory = AlgorithmFactory(
             self,
-            FunscriptKitModel.load_from_settings(),
+            self._funscript_kit(),
             self.page_media.model,
             self.page_media.current_media_sync(),
             self.page_media.current_media_sync(),
@@ -327,35 +385,17 @@ class Window(QMainWindow, Ui_MainWindow):
         )
 
         # volume tab
-        self.tab_volume.set_monitor_axis([
-            algorithm_factory.get_axis_alpha(),
-            algorithm_factory.get_axis_beta(),
-        ])
+        monitor_axes = (algorithm_factory.get_axis_alpha(), algorithm_factory.get_axis_beta())
+        if device.device_type == DeviceType.FOCSTIM_FOUR_PHASE:
+            monitor_axes += (algorithm_factory.get_axis_gamma(),)
+        if monitor_axes != self._last_monitor_axes:
+            self.tab_volume.set_monitor_axis(list(monitor_axes))
+            self._last_monitor_axes = monitor_axes
         self.tab_volume.axis_funscript_volume = algorithm_factory.get_axis_volume_api()
 
-        # continuous tab
-        self.tab_carrier.carrier_controller.link_axis(algorithm_factory.get_axis_continuous_carrier_frequency())
-
-        # pulse tab
-        self.tab_pulse_settings.carrier_controller.link_axis(algorithm_factory.get_axis_pulse_carrier_frequency())
-        self.tab_pulse_settings.pulse_frequency_controller.link_axis(algorithm_factory.get_axis_pulse_frequency())
-        self.tab_pulse_settings.pulse_width_controller.link_axis(algorithm_factory.get_axis_pulse_width())
-        self.tab_pulse_settings.pulse_interval_random_controller.link_axis(algorithm_factory.get_axis_pulse_interval_random())
-        self.tab_pulse_settings.pulse_rise_time_controller.link_axis(algorithm_factory.get_axis_pulse_rise_time())
-
-        # vibration tab
-        self.tab_vibrate.vib1_enabled_controller.link_axis(algorithm_factory.get_axis_vib1_enabled())
-        self.tab_vibrate.vib1_freq_controller.link_axis(algorithm_factory.get_axis_vib1_frequency())
-        self.tab_vibrate.vib1_strength_controller.link_axis(algorithm_factory.get_axis_vib1_strength())
-        self.tab_vibrate.vib1_left_right_bias_controller.link_axis(algorithm_factory.get_axis_vib1_left_right_bias())
-        self.tab_vibrate.vib1_high_low_bias_controller.link_axis(algorithm_factory.get_axis_vib1_high_low_bias())
-        self.tab_vibrate.vib1_random_controller.link_axis(algorithm_factory.get_axis_vib1_random())
-        self.tab_vibrate.vib2_enabled_controller.link_axis(algorithm_factory.get_axis_vib2_enabled())
-        self.tab_vibrate.vib2_freq_controller.link_axis(algorithm_factory.get_axis_vib2_frequency())
-        self.tab_vibrate.vib2_strength_controller.link_axis(algorithm_factory.get_axis_vib2_strength())
-        self.tab_vibrate.vib2_left_right_bias_controller.link_axis(algorithm_factory.get_axis_vib2_left_right_bias())
-        self.tab_vibrate.vib2_high_low_bias_controller.link_axis(algorithm_factory.get_axis_vib2_high_low_bias())
-        self.tab_vibrate.vib2_random_controller.link_axis(algorithm_factory.get_axis_vib2_random())
+        # parameter tabs
+        for controller, get_axis in self._axis_links:
+            controller.link_axis(get_axis(algorithm_factory))
 
         # neostim tab
         # TODO
@@ -367,45 +407,46 @@ class Window(QMainWindow, Ui_MainWindow):
             logger.info("autostart audio")
             self.signal_start()
 
-    def refresh_device_type(self):
-        def set_visible(widget, state):
-            self.tabWidget.setTabVisible(self.tabWidget.indexOf(widget), state)
-            self.tabWidget.setTabEnabled(self.tabWidget.indexOf(widget), state)
+    def _gamepad_to_motion4(self, a, b):
+        self.motion_4.mouse_event(a, b, 0.0)
 
-        all_tabs = {self.tab_threephase,
-                    self.tab_fourphase,
-                    self.tab_pulse_settings,
-                    self.tab_carrier,
-                    self.tab_volume,
-                    self.tab_vibrate,
-                    self.tab_details,
-                    self.tab_a_b_testing,
-                    self.tab_neostim}
+    def _gamepad_slot(self, motion):
+        return self.motion_3.mouse_event if motion is self.motion_3 else self._gamepad_to_motion4
 
-        visible = {self.tab_threephase, self.tab_volume, self.tab_vibrate, self.tab_details}
+    def _wire_motion(self, motion):
+        """
+        Connect velocity and gamepad input to motion, and disconnect them from
+        the previously wired motion generator
+        """
+        if motion is self._wired_motion:
+            return
+        previous = self._wired_motion
+        if previous is not None:
+            self.doubleSpinBox.valueChanged.disconnect(previous.set_velocity)
+            self.gamepad_handler.position_changed.disconnect(self._gamepad_slot(previous))
+            # settings are only refreshed for the wired generator, catch up
+            motion.refreshSettings()
+        self.doubleSpinBox.valueChanged.connect(motion.set_velocity)
+        self.gamepad_handler.position_changed.connect(self._gamepad_slot(motion))
+        motion.set_velocity(self.doubleSpinBox.value())
+        self._wired_motion = motion
 
-        config = DeviceConfiguration.from_settings()
+    def refresh_device_type(self):
+        def set_visible(widget, state):
+            index = self._tab_index[widget]
+            self.tabWidget.setTabVisible(index, state)
+            self.tabWidget.setTabEnabled(index, state)
 
-        # determine tab visibility
-        if config.device_type == DeviceType.AUDIO_THREE_PHASE:
-            if config.waveform_type == WaveformType.CONTINUOUS:
-                visible |= {self.tab_carrier}
-            if config.waveform_type == WaveformType.PULSE_BASED:
-                visible |= {self.tab_pulse_settings}
-            if config.waveform_type == WaveformType.A_B_TESTING:
-                visible |= {self.tab_a_b_testing}
-        if config.device_type == DeviceType.FOCSTIM_THREE_PHASE:
-            visible |= {self.tab_pulse_settings}
-            visible -= {self.tab_vibrate}
-        if config.device_type == DeviceType.FOCSTIM_FOUR_PHASE:
-            visible |= {self.tab_pulse_settings, self.tab_fourphase}
-            visible -= {self.tab_vibrate, self.tab_threephase, self.tab_details}
-        if config.device_type == DeviceType.NEOSTIM_THREE_PHASE:
-            visible |= {self.tab_neostim}
-            visible -= {self.tab_vibrate, self.tab_details}
+        config = self._device_config()
 
-        for tab in all_tabs:
-            set_visible(tab, tab in visible)
+        # determine tab visibility, only touch the tabs that changed
+        visible = self._visible_tabs_for.get((config.device_type, config.waveform_type),
+                                             self._default_visible_tabs)
+        if visible != self._visible_tabs:
+            changed = self._tab_index.keys() if self._visible_tabs is None else visible ^ self._visible_tabs
+            for tab in changed:
+                set_visible(tab, tab in visible)
+            self._visible_tabs = visible
 
         # set safety limits
         self.tab_carrier.set_safety_limits(config.min_frequency, config.max_frequency)
@@ -422,6 +463,7 @@ class Window(QMainWindow, Ui_MainWindow):
         if config.device_type in (DeviceType.AUDIO_THREE_PHASE, DeviceType.NEOSTIM_THREE_PHASE, DeviceType.FOCSTIM_THREE_PHASE):
             self.motion_3.set_enable(True)
             self.motion_4.set_enable(False)
+            self._wire_motion(self.motion_3)
             self.stackedWidget_visual.setCurrentIndex(
                 self.stackedWidget_visual.indexOf(self.page_threephase)
             )
@@ -429,6 +471,7 @@ class Window(QMainWindow, Ui_MainWindow):
         if config.device_type == DeviceType.FOCSTIM_FOUR_PHASE:
             self.motion_3.set_enable(False)
             self.motion_4.set_enable(True)
+            self._wire_motion(self.motion_4)
             self.stackedWidget_visual.setCurrentIndex(
                 self.stackedWidget_visual.indexOf(self.page_fourphase)
             )
@@ -441,6 +484,19 @@ class Window(QMainWindow, Ui_MainWindow):
             self.tab_threephase.phase_widget_calibration.set_background(foc=True)
 
         self.refresh_pattern_combobox()
+        self.bump_state_revision()
+
+    def _enqueue_tcode(self, cmd):
+        self._pending_tcode.append(cmd)
+        if not self._tcode_timer.isActive():
+            self._tcode_timer.start()
+
+    def _route_pending_tcode(self):
+        commands, self._pending_tcode = self._pending_tcode, []
+        self.tcode_command_router.route_commands(commands)
+
+    def bump_state_revision(self, *args):
+        self.state_revision += 1
 
     def pattern_selection_changed(self, index):
         pattern = self.comboBox_patternSelect.currentData()
@@ -457,10 +513,10 @@ class Window(QMainWindow, Ui_MainWindow):
         assert self.output_device is None
 
         self.autostart_timer.stop()
-        device = DeviceConfiguration.from_settings()
+        device = self._device_config()
         algorithm_factory = AlgorithmFactory(
             self,
-            FunscriptKitModel.load_from_settings(),
+            self._funscript_kit(),
             self.page_media.model,
             self.page_media.current_media_sync(),
             self.page_media.current_media_sync(),
@@ -471,8 +527,15 @@ class Window(QMainWindow, Ui_MainWindow):
         if device.device_type in [
             DeviceType.AUDIO_THREE_PHASE,
         ]: # is audio device
-            api_name = qt_ui.settings.audio_api.get() or sd.query_hostapis(sd.default.hostapi)['name']
-            output_device_name = qt_ui.settings.audio_output_device.get() or sd.query_devices(sd.default.device[1])['name']
+            import sounddevice as sd
+            from device.audio.audio_stim_device import AudioStimDevice
+
+            api_name = qt_ui.settings.audio_api.get()
+            output_device_name = qt_ui.settings.audio_output_device.get()
+            if not (api_name and output_device_name):
+                default_api_name, default_device_name = self._default_audio_output(sd)
+                api_name = api_name or default_api_name
+                output_device_name = output_device_name or default_device_name
             latency = qt_ui.settings.audio_latency.get() or 'high'
             try:
                 latency = float(latency)
@@ -483,11 +546,9 @@ class Window(QMainWindow, Ui_MainWindow):
             mapping_parameters = output_device.auto_detect_channel_mapping_parameters(algorithm)
             output_device.start(api_name, output_device_name, latency, algorithm, mapping_parameters)
             if output_device.is_connected_and_running():
-                self.output_device = output_device
-                self.playstate = PlayState.PLAYING
-                self.tab_volume.set_play_state(self.playstate)
-                self.refresh_play_button_icon()
+                self._finalize_start(output_device)
         elif device.device_type in (DeviceType.FOCSTIM_THREE_PHASE, DeviceType.FOCSTIM_FOUR_PHASE):
+            from device.focstim.proto_device import FOCStimProtoDevice
             output_device = FOCStimProtoDevice()
             use_teleplot = qt_ui.settings.focstim_use_teleplot.get()
             dump_notifications = qt_ui.settings.focstim_dump_notifications_to_file.get()
@@ -499,26 +560,35 @@ class Window(QMainWindow, Ui_MainWindow):
                 ip = qt_ui.settings.focstim_ip.get()
                 output_device.start_tcp(ip, 55533, use_teleplot, dump_notifications, algorithm)
             if output_device.is_connected_and_running():
-                self.output_device = output_device
-                self.playstate = PlayState.PLAYING
-                self.tab_volume.set_play_state(self.playstate)
-                self.refresh_play_button_icon()
+                self._finalize_start(output_device)
         elif device.device_type == DeviceType.NEOSTIM_THREE_PHASE:
+            from device.neostim.neostim_device import NeoStim
             output_device = NeoStim()
             serial_port_name = qt_ui.settings.neostim_serial_port.get()
             output_device.start(serial_port_name, algorithm)
             if output_device.is_connected_and_running():
-                self.output_device = output_device
-                self.playstate = PlayState.PLAYING
-                self.tab_volume.set_play_state(self.playstate)
-                self.refresh_play_button_icon()
+                self._finalize_start(output_device)
         else:
             raise RuntimeError("Unknown device type")
 
+    def _default_audio_output(self, sd):
+        # PortAudio queries block, only do them once per session
+        if self._default_audio_output_cache is None:
+            self._default_audio_output_cache = (
+                sd.query_hostapis(sd.default.hostapi)['name'],
+                sd.query_devices(sd.default.device[1])['name'],
+            )
+        return self._default_audio_output_cache
+
+    def _finalize_start(self, output_device):
+        self.output_device = output_device
+        self.playstate = PlayState.PLAYING
+        self.tab_volume.set_play_state(self.playstate)
+        self.refresh_play_button_icon()
+
         # Broadcast play state to web UI clients and remote instances
-        if self.playstate == PlayState.PLAYING:
-            self.webui_server.broadcast_play_state(self.playstate)
-            self.remote_control_send_play()
+        self.webui_server.broadcast_play_state(self.playstate)
+        self.remote_control_send_play()
 
     def signal_stop(self, new_playstate: PlayState = PlayState.STOPPED):
         if self.output_device is not None:
@@ -546,76 +616,123 @@ class Window(QMainWindow, Ui_MainWindow):
 
     def open_setup_wizard(self):
         self.signal_stop(PlayState.STOPPED)
+        if self.wizard is None:
+            from qt_ui.device_wizard.wizard import DeviceSelectionWizard
+            self.wizard = DeviceSelectionWizard(self)
         self.wizard.exec()
+        self.invalidate_settings_cache()
         self.refresh_device_type()
         self.reload_settings()
 
     def open_funscript_conversion_dialog(self):
         self.signal_stop(PlayState.STOPPED)
+        if self.dialog is None:
+            from qt_ui.funscript_conversion_dialog import FunscriptConversionDialog
+            self.dialog = FunscriptConversionDialog()
         self.dialog.exec()
 
     def open_simfile_conversion_dialog(self):
         self.signal_stop(PlayState.STOPPED)
+        if self.simfile_conversion_dialog is None:
+            from qt_ui.simfile_conversion_dialog import SimfileConversionDialog
+            self.simfile_conversion_dialog = SimfileConversionDialog()
         self.simfile_conversion_dialog.exec()
 
     def open_focstim_flash_dialog(self):
         self.signal_stop(PlayState.STOPPED)
+        if self.focstim_flash_dialog is None:
+            from qt_ui.focstim_flash_dialog import FocStimFlashDialog
+            self.focstim_flash_dialog = FocStimFlashDialog()
         self.focstim_flash_dialog.exec()
 
     def open_funscript_decomposition_dialog(self):
         self.signal_stop(PlayState.STOPPED)
+        if self.funscript_decomposition_dialog is None:
+            from qt_ui.funscript_decomposition_dialog import FunscriptDecompositionDialog
+            self.funscript_decomposition_dialog = FunscriptDecompositionDialog()
         self.funscript_decomposition_dialog.exec()
 
     def open_preferences_dialog(self):
         self.signal_stop(PlayState.STOPPED)
+        if self.settings_dialog is None:
+            from qt_ui.preferences_dialog import PreferencesDialog
+            self.settings_dialog = PreferencesDialog()
         self.settings_dialog.exec()
         self.reload_settings()
 
     def open_about_dialog(self):
         self.signal_stop(PlayState.STOPPED)
+        if self.about_dialog is None:
+            from qt_ui.about_dialog import AboutDialog
+            self.about_dialog = AboutDialog(self)
         self.about_dialog.exec()
 
     def open_write_audio_dialog(self):
-        device = DeviceConfiguration.from_settings()
-        kit = FunscriptKitModel.load_from_settings()
+        from qt_ui.audio_write_dialog import AudioWriteDialog
+
+        device = self._device_config()
+        kit = self._funscript_kit()
         filename = self.page_media.loaded_media_path
         dialog = AudioWriteDialog(self, kit, self.page_media.model, device, filename)
         dialog.exec()
 
+    def _device_config(self) -> DeviceConfiguration:
+        if self._device_config_cache is None:
+            self._device_config_cache = DeviceConfiguration.from_settings()
+        return self._device_config_cache
+
+    def _funscript_kit(self) -> FunscriptKitModel:
+        if self._funscript_kit_cache is None:
+            self._funscript_kit_cache = FunscriptKitModel.load_from_settings()
+        return self._funscript_kit_cache
+
+    def invalidate_settings_cache(self):
+        self._device_config_cache = None
+        self._funscript_kit_cache = None
+
     def reload_settings(self):
         """
         Reload everything that is stored in settings and may be changed
         by the preferences dialog
         """
+        self.invalidate_settings_cache()
         self.tcode_command_router.reload_kit()
         self.tab_volume.refreshSettings()
         self.buttplug_wsdm_client.refreshSettings()
         self.gamepad_handler.refreshSettings()
         self.funscript_mapping_changed()  # reload funscript axis
         self.tab_a_b_testing.refreshSettings()
-        self.motion_3.refreshSettings()
-        self.motion_4.refreshSettings()
+        self._wired_motion.refreshSettings()
         self.refresh_pattern_combobox()
+        self.webui_server.refreshSettings()
         self._refresh_remote_control()
 
     def refresh_pattern_combobox(self):
-        config = DeviceConfiguration.from_settings()
-        currently_selected_text = self.comboBox_patternSelect.currentText()
-
+        config = self._device_config()
         if config.device_type in (DeviceType.AUDIO_THREE_PHASE, DeviceType.NEOSTIM_THREE_PHASE, DeviceType.FOCSTIM_THREE_PHASE):
-            self.comboBox_patternSelect.clear()
-            for pattern in self.motion_3.patterns:
-                self.comboBox_patternSelect.addItem(pattern.name(), pattern)
+            motion = self.motion_3
         else:
-            self.comboBox_patternSelect.clear()
-            for pattern in self.motion_4.patterns:
-                self.comboBox_patternSelect.addItem(pattern.name(), pattern)
+            motion = self.motion_4
+
+        # refresh_patterns() replaces the list, an identical list object means the same items
+        if motion.patterns is self._pattern_list:
+            return
+        self._pattern_list = motion.patterns
+
+        currently_selected_text = self.comboBox_patternSelect.currentText()
+
+        self.comboBox_patternSelect.blockSignals(True)
+        self.comboBox_patternSelect.clear()
+        for pattern in motion.patterns:
+            self.comboBox_patternSelect.addItem(pattern.name(), pattern)
 
         # try to select pattern with similar name as was previously selected
         index = self.comboBox_patternSelect.findText(currently_selected_text)
         if index == -1:
             index = 0
         self.comboBox_patternSelect.setCurrentIndex(index)
+        self.comboBox_patternSelect.blockSignals(False)
+        self.comboBox_patternSelect.currentIndexChanged.emit(index)
 
 
     def save_settings(self):
@@ -663,9 +780,11 @@ class Window(QMainWindow, Ui_MainWindow):
         """Handle gamepad button for pulse width adjustment"""
         step = qt_ui.settings.gamepad_pulse_width_step.get()
         if self.tab_pulse_settings.isVisible():
-            current = self.tab_pulse_settings.pulse_width_slider.value()
-            new_value = current + (direction * step)
-            self.tab_pulse_settings.pulse_width_slider.setValue(new_value)
+            slider = self.tab_pulse_settings.pulse_width_slider
+            # Applied directly, steps come from a button press or the repeat timer
+            # (20ms or slower), so there are no bursts to coalesce
+            new_value = min(max(slider.value() + (direction * step), slider.minimum()), slider.maximum())
+            slider.setValue(new_value)
 
     def gamepad_shock_triggered(self):
         """Handle gamepad shock button press - raise volume while held"""
@@ -699,85 +818,114 @@ class Window(QMainWindow, Ui_MainWindow):
 
     def _init_remote_control(self):
         """Initialize the remote control client."""
-        self._refresh_remote_control()
-
-        # Timer for sending position updates to remote instances (~30Hz)
+        # Timer for sending position updates to remote instances (~30Hz),
+        # only runs while position sync is enabled and an instance is connected
         self._remote_position_timer = QTimer(self)
+        # coarse timers may fire up to 5% late, which shows up as jitter on the remote instances
+        self._remote_position_timer.setTimerType(Qt.PreciseTimer)
+        self._remote_position_timer.setInterval(33)
         self._remote_position_timer.timeout.connect(self._remote_broadcast_position)
-        self._remote_position_timer.start(33)
+        self.remote_control.connection_changed.connect(self._remote_connection_changed)
+        # raw instances setting last passed to set_instances()
+        self._instances_json_cache = None
+        # last (alpha, beta, gamma) handed to remote_control
+        self._last_sent_position = None
 
-        if qt_ui.settings.remote_control_enabled.get():
-            self.remote_control.start()
+        self._refresh_remote_control()
+
+    def _remote_connection_changed(self, url: str, connected: bool):
+        # newly connected instances need the current position
+        self._last_sent_position = None
+        self._update_remote_position_timer()
+
+    def _update_remote_position_timer(self):
+        count = self.remote_control.get_connected_count()
+        if self._rc_sync_position and count > 0:
+            # 30Hz for a few instances, slowing down quadratically beyond that
+            self._remote_position_timer.setInterval(min(1000, 33 + max(0, count - 4) ** 2 * 7))
+            if not self._remote_position_timer.isActive():
+                self._remote_position_timer.start()
+        else:
+            self._remote_position_timer.stop()
 
     def _remote_broadcast_position(self):
         """Send current position to remote instances."""
-        if qt_ui.settings.remote_control_enabled.get() and qt_ui.settings.remote_control_sync_position.get():
-            if self.remote_control.get_connected_count() > 0:
-                self.remote_control.send_position(
-                    self.alpha.last_value(),
-                    self.beta.last_value(),
-                    self.gamma.last_value()
-                )
+        position = self._position_snapshot()
+        last = self._last_sent_position
+        if last is not None and (abs(position[0] - last[0]) < REMOTE_POSITION_EPSILON
+                                 and abs(position[1] - last[1]) < REMOTE_POSITION_EPSILON
+                                 and abs(position[2] - last[2]) < REMOTE_POSITION_EPSILON):
+            return
+        self._last_sent_position = position
+        self.remote_control.send_position(*position)
+
+    def _position_snapshot(self) -> tuple[float, float, float]:
+        """Latest (alpha, beta, gamma) as python floats."""
+        return float(self.alpha.last_value()), float(self.beta.last_value()), float(self.gamma.last_value())
 
     def _refresh_remote_control(self):
         """Refresh remote control settings."""
-        import json
-        from net.remote_control import RemoteInstance
-
-        # Load instances from settings
-        try:
-            instances_json = qt_ui.settings.remote_control_instances.get()
-            instances_data = json.loads(instances_json)
-            instances = []
-            for data in instances_data:
-                instances.append(RemoteInstance(
-                    url=data.get('url', ''),
-                    enabled=data.get('enabled', True),
-                    username=data.get('username', ''),
-                    password=data.get('password', '')
-                ))
-            self.remote_control.set_instances(instances)
-        except Exception as e:
-            logger.warning(f"Failed to load remote control instances: {e}")
+        # read by the remote_control_send_* methods, which run on every user event
+        self._rc_enabled = qt_ui.settings.remote_control_enabled.get()
+        self._rc_sync_position = self._rc_enabled and qt_ui.settings.remote_control_sync_position.get()
+        self._rc_sync_volume = self._rc_enabled and qt_ui.settings.remote_control_sync_volume.get()
+        self._rc_sync_carrier = self._rc_enabled and qt_ui.settings.remote_control_sync_carrier.get()
+        self._rc_sync_play_state = self._rc_enabled and qt_ui.settings.remote_control_sync_play_state.get()
+
+        # Load instances from settings, set_instances() reconnects so skip it when they did not change
+        instances_json = qt_ui.settings.remote_control_instances.get()
+        if instances_json != self._instances_json_cache:
+            self._instances_json_cache = instances_json
+            try:
+                instances = net.remote_control.parse_instances(instances_json)
+                self.remote_control.set_instances(instances)
+            except Exception as e:
+                logger.warning(f"Failed to load remote control instances: {e}")
 
         # Start or stop based on enabled setting
-        if qt_ui.settings.remote_control_enabled.get():
+        if self._rc_enabled:
             self.remote_control.start()
         else:
             self.remote_control.stop()
+        self._update_remote_position_timer()
 
     def remote_control_send_position(self, alpha: float, beta: float):
         """Send position update to remote instances."""
-        if qt_ui.settings.remote_control_enabled.get() and qt_ui.settings.remote_control_sync_position.get():
-            self.remote_control.send_position(alpha, beta, self.gamma.last_value())
+        if self._rc_sync_position:
+            self._last_sent_position = (alpha, beta, self.gamma.last_value())
+            self.remote_control.send_position(*self._last_sent_position)
 
     def remote_control_send_volume(self, value: float):
         """Send volume update to remote instances."""
-        if qt_ui.settings.remote_control_enabled.get() and qt_ui.settings.remote_control_sync_volume.get():
+        if self._rc_sync_volume:
             self.remote_control.send_volume(value)
 
     def remote_control_send_carrier(self, frequency: float):
         """Send carrier frequency update to remote instances."""
-        if qt_ui.settings.remote_control_enabled.get() and qt_ui.settings.remote_control_sync_carrier.get():
+        if self._rc_sync_carrier:
             self.remote_control.send_carrier(frequency)
 
     def remote_control_send_play(self):
         """Send play command to remote instances."""
-        if qt_ui.settings.remote_control_enabled.get() and qt_ui.settings.remote_control_sync_play_state.get():
+        if self._rc_sync_play_state:
             self.remote_control.send_play()
 
     def remote_control_send_stop(self):
         """Send stop command to remote instances."""
-        if qt_ui.settings.remote_control_enabled.get() and qt_ui.settings.remote_control_sync_play_state.get():
+        if self._rc_sync_play_state:
             self.remote_control.send_stop()
 
     def closeEvent(self, event):
         logger.warning('Shutting down')
+        # remote_control.stop() only touches its own event loop thread, let it
+        # wind down while the Qt owned components are stopped here
+        remote_control_stop = threading.Thread(target=self.remote_control.stop, daemon=True)
+        remote_control_stop.start()
         if self.output_device is not None:
             self.output_device.stop()
         self.gamepad_handler.set_enabled(False)
         self.webui_server.stop()
-        self.remote_control.stop()
+        remote_control_stop.join(timeout=2.0)
         self.save_settings()
         event.accept()
 
@@ -1,4 +1,5 @@
 import functools
+import json
 import logging
 
 import google.protobuf.text_format
@@ -327,7 +328,6 @@ class PreferencesDialog(QDialog, Ui_PreferencesDialog):
         self.remote_sync_carrier.setChecked(qt_ui.settings.remote_control_sync_carrier.get())
         self.remote_sync_play_state.setChecked(qt_ui.settings.remote_control_sync_play_state.get())
         # Load remote instances
-        import json
         try:
             instances_json = qt_ui.settings.remote_control_instances.get()
             instances = json.loads(instances_json)
@@ -550,7 +550,6 @@ class PreferencesDialog(QDialog, Ui_PreferencesDialog):
         qt_ui.settings.remote_control_sync_carrier.set(self.remote_sync_carrier.isChecked())
         qt_ui.settings.remote_control_sync_play_state.set(self.remote_sync_play_state.isChecked())
         # Save remote instances as JSON
-        import json
         instances = []
         for i in range(self.remote_instances_list.count()):
             url = self.remote_instances_list.item(i).text()
@@ -21,101 +21,52 @@ class Route:
 
 
 class TCodeCommandRouter:
-    def __init__(self,
-                 alpha: AbstractAxis,
-                 beta: AbstractAxis,
-                 gamma: AbstractAxis,
-
-                 volume_api: AbstractAxis,
-                 volume_external: AbstractAxis,
-
-                 carrier_frequency: AbstractAxis,   # either pulse of continuous
-
-                 pulse_frequency: AbstractAxis,
-                 pulse_width: AbstractAxis,
-                 pulse_interval_random: AbstractAxis,
-                 pulse_rise_time: AbstractAxis,
-
-                 vibration_1_frequency: AbstractAxis,
-                 vibration_1_strength: AbstractAxis,
-                 vibration_1_left_right_bias: AbstractAxis,
-                 vibration_1_high_low_bias: AbstractAxis,
-                 vibration_1_random: AbstractAxis,
-
-                 vibration_2_frequency: AbstractAxis,
-                 vibration_2_strength: AbstractAxis,
-                 vibration_2_left_right_bias: AbstractAxis,
-                 vibration_2_high_low_bias: AbstractAxis,
-                 vibration_2_random: AbstractAxis,
-                 ):
-        self.alpha = alpha
-        self.beta = beta
-        self.gamma = gamma
-        self.volume_api = volume_api
-        self.volume_external = volume_external
-        self.carrier_frequency = carrier_frequency
-        self.pulse_frequency = pulse_frequency
-        self.pulse_width = pulse_width
-        self.pulse_interval_random = pulse_interval_random
-        self.pulse_rise_time = pulse_rise_time
-        self.vibration_1_frequency = vibration_1_frequency
-        self.vibration_1_strength = vibration_1_strength
-        self.vibration_1_left_right_bias = vibration_1_left_right_bias
-        self.vibration_1_high_low_bias = vibration_1_high_low_bias
-        self.vibration_1_random = vibration_1_random
-        self.vibration_2_frequency = vibration_2_frequency
-        self.vibration_2_strength = vibration_2_strength
-        self.vibration_2_left_right_bias = vibration_2_left_right_bias
-        self.vibration_2_high_low_bias = vibration_2_high_low_bias
-        self.vibration_2_random = vibration_2_random
-
+    def __init__(self, axes: dict[AxisEnum, AbstractAxis]):
+        """
+        :param axes: the axis to drive for every routable AxisEnum. The entry for
+            CARRIER_FREQUENCY is either the pulse or continuous carrier, see set_carrier_axis()
+        """
+        self.axes = dict(axes)
+
+        # (tcode axis name, AxisEnum, limit_min, limit_max) from the funscript kit
+        self.kit_routes = []
         self.mapping = {}
         self.reload_kit()
 
     def reload_kit(self):
-        axis_enum_to_axis = {
-            AxisEnum.POSITION_ALPHA: self.alpha,
-            AxisEnum.POSITION_BETA: self.beta,
-            AxisEnum.POSITION_GAMMA: self.gamma,
-            AxisEnum.VOLUME_API: self.volume_api,
-            AxisEnum.VOLUME_EXTERNAL: self.volume_external,
-            AxisEnum.CARRIER_FREQUENCY: self.carrier_frequency,
-
-            AxisEnum.PULSE_FREQUENCY: self.pulse_frequency,
-            AxisEnum.PULSE_WIDTH: self.pulse_width,
-            AxisEnum.PULSE_INTERVAL_RANDOM: self.pulse_interval_random,
-            AxisEnum.PULSE_RISE_TIME: self.pulse_rise_time,
-
-            AxisEnum.VIBRATION_1_FREQUENCY: self.vibration_1_frequency,
-            AxisEnum.VIBRATION_1_STRENGTH: self.vibration_1_strength,
-            AxisEnum.VIBRATION_1_LEFT_RIGHT_BIAS: self.vibration_1_left_right_bias,
-            AxisEnum.VIBRATION_1_HIGH_LOW_BIAS: self.vibration_1_high_low_bias,
-            AxisEnum.VIBRATION_1_RANDOM: self.vibration_1_random,
-
-            AxisEnum.VIBRATION_2_FREQUENCY: self.vibration_2_frequency,
-            AxisEnum.VIBRATION_2_STRENGTH: self.vibration_2_strength,
-            AxisEnum.VIBRATION_2_LEFT_RIGHT_BIAS: self.vibration_2_left_right_bias,
-            AxisEnum.VIBRATION_2_HIGH_LOW_BIAS: self.vibration_2_high_low_bias,
-            AxisEnum.VIBRATION_2_RANDOM: self.vibration_2_random,
-        }
-
         kit = FunscriptKitModel.load_from_settings()
-        mapping = {}
+        kit_routes = []
         for child in kit.children:
             child: FunscriptKitItem
             if len(child.tcode_axis_name) == 2:
-                if child.axis in axis_enum_to_axis:
-                    route = Route(axis_enum_to_axis[child.axis], child.limit_min, child.limit_max)
-                    if child.tcode_axis_name not in mapping:
-                        mapping[child.tcode_axis_name] = route
+                kit_routes.append((child.tcode_axis_name, child.axis, child.limit_min, child.limit_max))
             elif len(child.tcode_axis_name) != 0:
                 logger.error(f'Invalid T-Code axis name: {child.tcode_axis_name}. Axis name must be 2 chars.')
 
+        self.kit_routes = kit_routes
+        self.rebuild_mapping()
+
+    def rebuild_mapping(self):
+        mapping = {}
+        for tcode_axis_name, axis, limit_min, limit_max in self.kit_routes:
+            if axis in self.axes and tcode_axis_name not in mapping:
+                mapping[tcode_axis_name] = Route(self.axes[axis], limit_min, limit_max)
         self.mapping = mapping
 
     def set_carrier_axis(self, carrier: AbstractAxis):
-        self.carrier_frequency = carrier
-        self.reload_kit()
+        self.axes[AxisEnum.CARRIER_FREQUENCY] = carrier
+        self.rebuild_mapping()
+
+    def route_commands(self, cmds: list[TCodeCommand]):
+        """
+        Route a batch of commands. When an axis is commanded more than once,
+        only the last command is applied.
+        """
+        latest = {}
+        for cmd in cmds:
+            latest[cmd.axis_identifier] = cmd
+        for cmd in latest.values():
+            self.route_command(cmd)
 
     def route_command(self, cmd: TCodeCommand):
         try:
@@ -310,6 +310,27 @@ function setupWebSocket() {
         updateFullState(payload);
     });
 
+    // Narrow updates carry one part of the full state
+    restimWS.on('volume_update', (payload) => {
+        updateFullState({ volume: payload });
+    });
+
+    restimWS.on('carrier_update', (payload) => {
+        updateFullState({ carrier: payload.frequency });
+    });
+
+    restimWS.on('pulse_update', (payload) => {
+        updateFullState({ pulse: payload });
+    });
+
+    restimWS.on('pattern_update', (payload) => {
+        updateFullState({ pattern: payload });
+    });
+
+    restimWS.on('vibration_update', (payload) => {
+        updateFullState({ vibration: payload });
+    });
+
     restimWS.on('position_update', (payload) => {
         updatePosition(payload.alpha, payload.beta, payload.gamma);
     });
@@ -358,7 +379,7 @@ function updateFullState(state) {
     }
 
     // Volume
-    if (state.volume) {
+    if (state.volume && state.volume.master !== undefined) {
         volumeSlider.setValue(state.volume.master);
     }
 
@@ -393,22 +414,26 @@ function updateFullState(state) {
     if (state.vibration) {
         if (state.vibration.vibration1) {
             const v1 = state.vibration.vibration1;
-            vib1Enabled.setChecked(v1.enabled);
-            vib1Freq.setValue(v1.frequency);
-            vib1Strength.setValue(v1.strength);
+            if (v1.enabled !== undefined) vib1Enabled.setChecked(v1.enabled);
+            if (v1.frequency !== undefined) vib1Freq.setValue(v1.frequency);
+            if (v1.strength !== undefined) vib1Strength.setValue(v1.strength);
         }
         if (state.vibration.vibration2) {
             const v2 = state.vibration.vibration2;
-            vib2Enabled.setChecked(v2.enabled);
-            vib2Freq.setValue(v2.frequency);
-            vib2Strength.setValue(v2.strength);
+            if (v2.enabled !== undefined) vib2Enabled.setChecked(v2.enabled);
+            if (v2.frequency !== undefined) vib2Freq.setValue(v2.frequency);
+            if (v2.strength !== undefined) vib2Strength.setValue(v2.strength);
         }
     }
 
     // Device info
     if (state.device) {
-        document.getElementById('device-type').textContent = `Type: ${state.device.type}`;
-        document.getElementById('waveform-type').textContent = `Waveform: ${state.device.waveformType}`;
+        if (state.device.type !== undefined) {
+            document.getElementById('device-type').textContent = `Type: ${state.device.type}`;
+        }
+        if (state.device.waveformType !== undefined) {
+            document.getElementById('waveform-type').textContent = `Waveform: ${state.device.waveformType}`;
+        }
     }
 }
 
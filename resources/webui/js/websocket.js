@@ -50,8 +50,12 @@ class RestimWebSocket {
 
         this.ws.onmessage = (event) => {
             try {
-                const message = JSON.parse(event.data);
-                this.emit(message.type, message.payload, message.timestamp);
+                const data = JSON.parse(event.data);
+                // Broadcasts arrive batched as an array of messages
+                const messages = Array.isArray(data) ? data : [data];
+                for (const message of messages) {
+                    this.emit(message.type, message.payload, message.timestamp);
+                }
             } catch (e) {
                 console.error('Failed to parse message:', e, event.data);
             }